@@ -1,22 +1,41 @@
 # Version: 13.4.0 - Dashboard Redesign & Performance Boost
 import os
+import sys
 import re
 import io
 import json
+import html
+import secrets
+import mimetypes
+import shutil
+import tempfile
+import zipfile
+import bisect
+import heapq
+import itertools
 import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+import httplib2
+import httpx
+import numpy as np
 import pandas as pd
 import streamlit as st
-import ast
+import copy
 import gspread
 import smtplib
 import ssl
 import altair as alt
-from collections import Counter, defaultdict
+from array import array
+from collections import Counter, OrderedDict, deque
 from email.message import EmailMessage
 from google.auth.transport.requests import Request as GoogleAuthRequest
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from google.oauth2.credentials import Credentials
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials
 
@@ -25,19 +44,52 @@ st.set_page_config(page_title="Cloud Drive Manager", page_icon="☁️", layout=
 
 AUTHORIZED_USERS_SHEET_URL = "https://docs.google.com/spreadsheets/d/1Z_SANZWikklPWXntLojdMgwXJs45FDFPKxr4gRBNqco/edit?gid=0#gid=0"
 APP_NAME = "Google Drive Manager"
+DRIVE_API_URL = "https://www.googleapis.com/drive/v3"
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3"
+DRIVE_BATCH_URL = "https://www.googleapis.com/batch/drive/v3"
+DRIVE_BATCH_SIZE = 100  # Drive accepts at most 100 calls per batch request
+ASYNC_MAX_CONNECTIONS = 64
+ASYNC_MAX_IN_FLIGHT = 200
+DRIVE_PROJECT_RATE = 200  # requests/second shared by every session (Drive default: 12,000 per minute per project)
+DRIVE_USER_RATE = 40  # requests/second for any single user
+DRIVE_INTERACTIVE_RESERVE = 20  # project tokens bulk work may never consume, kept for interactive reads
+DRIVE_MAX_RETRIES = 5
+TRASH_JOB_HISTORY = 20  # undo-log entries kept per session
+PRIORITY_INTERACTIVE, PRIORITY_BULK = 0, 1
+SNAPSHOT_TTL_SECONDS = 600
+SNAPSHOT_PARTITION_AGE_DAYS = [30, 90, 180, 365, 730, 1095, 1825, 2920]  # modifiedTime boundaries for parallel snapshot scans
+DEST_PICKER_PAGE_SIZE = 100  # subfolders fetched per page in the destination picker
+PLAN_SECONDS_PER_CALL = 0.4  # typical Drive mutation round trip, used for dry-run runtime estimates
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # must be a multiple of 256 KiB
+UPLOAD_PARALLEL_FILES = 4
+UPLOAD_MAX_CHUNK_FAILURES = 5
+DOWNLOAD_PARALLEL_FILES = 8
+DOWNLOAD_SPOOL_SIZE = 8 * 1024 * 1024  # larger downloads spill from memory to a temp file
+DOWNLOAD_ZIP_DIR = os.path.join(tempfile.gettempdir(), 'drive-manager-zips')
+DOWNLOAD_ZIP_MAX_AGE_SECONDS = 3600  # archives left behind by ended sessions are swept after this
+APP_STATIC_ZIP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'zips')
+STATIC_SERVING_MAX_BYTES = 200 * 1024 * 1024  # Streamlit's app/static route refuses larger files
+SEARCH_INDEX_MAX_ENTRIES = 400000  # indexed items kept across all users' name indexes
+SEARCH_INDEX_IDLE_SECONDS = 1800
+EXPORT_FORMATS = {
+    'application/vnd.google-apps.document': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx'),
+    'application/vnd.google-apps.spreadsheet': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+    'application/vnd.google-apps.presentation': ('application/vnd.openxmlformats-officedocument.presentationml.presentation', '.pptx'),
+    'application/vnd.google-apps.drawing': ('image/png', '.png'),
+}
 
 SESSION_DEFAULTS = {
     'google_creds': None, 'page': "Dashboard", 'user_info': None,
     'authorization_request_sent': False, 'snapshot_loaded': False,
-    'fetched_file_details': None, 'folder_contents_df': None,
-    'edited_df': pd.DataFrame(), 'copied_files_df': None, 'skipped_files_df': None,
+    'fetched_file_details': None, 'folder_contents': None,
+    'copied_files_df': None, 'skipped_files_df': None,
     'dest_id': None, 'current_folder_id': 'root',
     'folder_path': [{'name': 'My Drive', 'id': 'root'}],
     'item_to_rename': None, 'item_to_delete': None,
     'initial_fetch_done': False, 'cleaner_link': "", 'cleaner_state': 'initial',
-    'cleaner_root_details': None, 'cleaner_all_items': [],
-    'cleaner_success_log': None, 'cleaner_skipped_log': None,
-    'cleaner_dest_folder_name': None, 'last_operation_summary': None
+    'cleaner_root_details': None, 'cleaner_contents': None, 'cleaner_log': None,
+    'cleaner_dest_folder_name': None, 'last_operation_summary': None,
+    'trash_jobs': []
 }
 for key, default_value in SESSION_DEFAULTS.items():
     if key not in st.session_state:
@@ -146,12 +198,305 @@ def show_access_denied_page(user_email):
 
 def get_drive_storage_info(_service):
     try:
-        about = _service.about().get(fields='storageQuota,user').execute()
+        about = execute_request(_service.about().get(fields='storageQuota,user'), (st.session_state.get('user_info') or {}).get('user_email', 'anonymous'))
         storage = about.get('storageQuota', {}); user = about.get('user', {})
         limit = int(storage.get('limit', 1)); usage = int(storage.get('usage', 0))
         return {'user_name': user.get('displayName', 'N/A'), 'user_email': user.get('emailAddress', 'N/A'), 'limit_gb': limit / (1024**3), 'usage_gb': usage / (1024**3), 'usage_percent': (usage / limit * 100) if limit > 0 else 0}
     except Exception: return None
 
+# --- ASYNC DRIVE CLIENT ---
+# One event loop and one pooled HTTP/2 client per process. Script threads submit coroutines to the loop,
+# so hundreds of Drive requests can be in flight without a thread (and httplib2 transport) per request.
+
+@st.cache_resource
+def get_async_runtime():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="drive-async-loop", daemon=True).start()
+    limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS, keepalive_expiry=120)
+    http = httpx.AsyncClient(http2=True, limits=limits, timeout=httpx.Timeout(60.0, connect=10.0))
+    return loop, http
+
+def submit_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_async_runtime()[0])
+
+def run_async(coro):
+    return submit_async(coro).result()
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate, self.capacity = rate, capacity
+        self.tokens, self.updated = float(capacity), time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate); self.updated = now
+
+    def time_until(self, amount, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount=1):
+        self.tokens -= amount
+
+class DriveRequestScheduler:
+    # Process-wide gate in front of every Drive call. Waiters are served interactive-first, round-robin across users,
+    # and only when both the shared project bucket and the user's own bucket have a token.
+    def __init__(self, project_rate=DRIVE_PROJECT_RATE, user_rate=DRIVE_USER_RATE, interactive_reserve=DRIVE_INTERACTIVE_RESERVE):
+        self.project_bucket = TokenBucket(project_rate, project_rate)
+        self.user_rate = user_rate
+        self.interactive_reserve = interactive_reserve
+        self.user_buckets = {}
+        self.queues = {PRIORITY_INTERACTIVE: OrderedDict(), PRIORITY_BULK: OrderedDict()}
+        self.recent_waits = {PRIORITY_INTERACTIVE: deque(maxlen=500), PRIORITY_BULK: deque(maxlen=500)}
+        self.granted = Counter()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+    async def acquire(self, user, priority=PRIORITY_INTERACTIVE):
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues[priority].setdefault(user, deque()).append((waiter, time.monotonic()))
+        if self._dispatcher is None or self._dispatcher.done(): self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await waiter
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._grant_ready()
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError: pass
+
+    def _grant_ready(self):
+        # Grants every request that can go now; returns seconds until the next one could, or None if nothing waits.
+        now, next_delay = time.monotonic(), None
+        def sooner(delay): return delay if next_delay is None else min(next_delay, delay)
+        for priority, waiting in self.queues.items():
+            reserve = 0 if priority == PRIORITY_INTERACTIVE else self.interactive_reserve
+            while waiting:
+                project_wait = self.project_bucket.time_until(1 + reserve, now)
+                if project_wait > 0: next_delay = sooner(project_wait); break
+                granted = False
+                for user in list(waiting):
+                    queue = waiting[user]
+                    while queue and queue[0][0].done(): queue.popleft()
+                    if not queue: del waiting[user]; continue
+                    bucket = self.user_buckets.setdefault(user, TokenBucket(self.user_rate, self.user_rate))
+                    user_wait = bucket.time_until(1, now)
+                    if user_wait > 0: next_delay = sooner(user_wait); continue
+                    waiter, enqueued_at = queue.popleft()
+                    bucket.take(); self.project_bucket.take()
+                    waiter.set_result(None); self.recent_waits[priority].append(now - enqueued_at); self.granted[priority] += 1
+                    if queue: waiting.move_to_end(user)
+                    else: del waiting[user]
+                    granted = True; break
+                if not granted: break
+        return next_delay
+
+    async def stats(self, user=None):
+        def depth(queues): return sum(len(q) for q in queues)
+        summary = {}
+        for priority, label in ((PRIORITY_INTERACTIVE, 'interactive'), (PRIORITY_BULK, 'bulk')):
+            waits = list(self.recent_waits[priority])
+            summary[label] = {
+                'queue_depth': depth(self.queues[priority].values()),
+                'user_queue_depth': len(self.queues[priority].get(user, ())),
+                'avg_wait_ms': 1000 * sum(waits) / len(waits) if waits else 0.0,
+                'max_wait_ms': 1000 * max(waits) if waits else 0.0,
+                'granted': self.granted[priority],
+            }
+        summary['active_users'] = len(set(self.queues[PRIORITY_INTERACTIVE]) | set(self.queues[PRIORITY_BULK]))
+        return summary
+
+@st.cache_resource
+def get_drive_scheduler():
+    return DriveRequestScheduler()
+
+def execute_request(request, user, priority=PRIORITY_INTERACTIVE):
+    # Synchronous discovery-client calls wait for a scheduler slot like the async client does.
+    run_async(get_drive_scheduler().acquire(user, priority))
+    return request.execute()
+
+class AsyncDriveClient:
+    def __init__(self, creds, user, priority=PRIORITY_INTERACTIVE, max_in_flight=ASYNC_MAX_IN_FLIGHT, on_refresh=None):
+        self.creds, self.user, self.priority, self.on_refresh = creds, user, priority, on_refresh
+        self.http = get_async_runtime()[1]
+        self.scheduler = get_drive_scheduler()
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self._refresh_lock = asyncio.Lock()
+
+    async def _auth_headers(self):
+        async with self._refresh_lock:
+            if not self.creds.valid and self.creds.refresh_token:
+                # The refresh is a blocking HTTP call; run it off the shared loop so other sessions' I/O keeps moving.
+                await asyncio.to_thread(self.creds.refresh, GoogleAuthRequest())
+                if self.on_refresh: self.on_refresh(self.creds)
+        return {'Authorization': f"Bearer {self.creds.token}"}
+
+    def with_priority(self, priority):
+        # Shares credentials and the in-flight semaphore; only the scheduler priority differs.
+        clone = copy.copy(self); clone.priority = priority; return clone
+
+    async def _send(self, method, url, headers=None, retry=True, **kwargs):
+        for attempt in range(DRIVE_MAX_RETRIES + 1):
+            await self.scheduler.acquire(self.user, self.priority); auth = await self._auth_headers()
+            try:
+                async with self.semaphore:
+                    resp = await self.http.request(method, url, headers={**auth, **(headers or {})}, **kwargs)
+            except httpx.TransportError as e:
+                # Timeouts, resets and HTTP/2 GOAWAYs are routine on shared connections: back off like a 5xx, and once retries
+                # run out surface an HttpError so callers' existing handling applies. Uploads (retry=False) resume themselves.
+                if not retry: raise
+                if attempt < DRIVE_MAX_RETRIES: await asyncio.sleep(min(2 ** attempt, 32) + random.random()); continue
+                raise HttpError(httplib2.Response({'status': 503, 'reason': f"Connection error: {e}"}), b'', uri=url)
+            rate_limited = resp.status_code == 429 or (resp.status_code == 403 and b'ateLimitExceeded' in resp.content)
+            if retry and (rate_limited or resp.status_code >= 500) and attempt < DRIVE_MAX_RETRIES:
+                await asyncio.sleep(min(2 ** attempt, 32) + random.random()); continue
+            return resp
+
+    @staticmethod
+    def raise_for_status(resp):
+        if resp.status_code >= 400:
+            # Raise the same error type as the discovery client so existing `except HttpError` handling keeps working.
+            raise HttpError(httplib2.Response({'status': resp.status_code, 'reason': resp.reason_phrase}), resp.content, uri=str(resp.url))
+
+    async def _request(self, method, path, params=None, body=None):
+        resp = await self._send(method, f"{DRIVE_API_URL}/{path}", params=params, json=body)
+        self.raise_for_status(resp)
+        return resp.json() if resp.content else {}
+
+    async def list(self, **params):
+        return await self._request('GET', 'files', params=params)
+
+    async def list_all(self, **params):
+        files, page_token = [], None
+        while True:
+            results = await self.list(**params, **({'pageToken': page_token} if page_token else {}))
+            files.extend(results.get('files', [])); page_token = results.get('nextPageToken')
+            if not page_token: return files
+
+    async def get(self, fileId, **params):
+        return await self._request('GET', f"files/{fileId}", params=params)
+
+    async def copy(self, fileId, body, **params):
+        return await self._request('POST', f"files/{fileId}/copy", params=params, body=body)
+
+    async def update(self, fileId, body, **params):
+        return await self._request('PATCH', f"files/{fileId}", params=params, body=body)
+
+    async def delete(self, fileId, **params):
+        return await self._request('DELETE', f"files/{fileId}", params=params)
+
+    async def create(self, body, **params):
+        return await self._request('POST', 'files', params=params, body=body)
+
+    async def _send_batch(self, method, paths, body, params):
+        # One multipart/mixed POST carrying up to DRIVE_BATCH_SIZE calls. Each part still counts against quota, so each takes a token.
+        await asyncio.gather(*(self.scheduler.acquire(self.user, self.priority) for _ in paths))
+        boundary, query, payload = f"batch_{random.getrandbits(64):016x}", str(httpx.QueryParams(params)), json.dumps(body)
+        parts = [f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <{i}>\r\n\r\n{method} /drive/v3/{path}{'?' + query if query else ''}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{payload}\r\n" for i, path in enumerate(paths)]
+        try:
+            auth = await self._auth_headers()
+            async with self.semaphore:
+                resp = await self.http.post(DRIVE_BATCH_URL, content=(''.join(parts) + f"--{boundary}--\r\n").encode(), headers={**auth, 'Content-Type': f"multipart/mixed; boundary={boundary}"})
+        except httpx.TransportError as e:
+            # A dropped connection fails only this chunk; its parts are reported as retryable like a 5xx.
+            return {i: (503, json.dumps({'error': {'message': f"Connection error: {e}"}}).encode()) for i in range(len(paths))}
+        if resp.status_code >= 400: return {i: (resp.status_code, resp.content) for i in range(len(paths))}
+        return self.parse_batch_response(resp)
+
+    @staticmethod
+    def parse_batch_response(resp):
+        # Maps each part's Content-ID back to its (status, body).
+        boundary = re.search(r'boundary="?([^";]+)"?', resp.headers.get('Content-Type', '')).group(1).encode()
+        results = {}
+        for part in resp.content.split(b'--' + boundary)[1:-1]:
+            outer, inner, *body = re.split(rb'\r?\n\r?\n', part.strip(), maxsplit=2)
+            content_id = re.search(rb'Content-ID:\s*<response-(\d+)>', outer, re.I)
+            if content_id: results[int(content_id.group(1))] = (int(inner.split(None, 2)[1]), body[0] if body else b'')
+        return results
+
+    async def batch_update(self, file_ids, body, **params):
+        # PATCHes every file with the same body through the batch endpoint; throttled or failed parts are retried.
+        # Returns {file_id: HttpError or None}.
+        errors, pending = {}, list(dict.fromkeys(file_ids))
+        for attempt in range(DRIVE_MAX_RETRIES + 1):
+            chunks = [pending[start:start + DRIVE_BATCH_SIZE] for start in range(0, len(pending), DRIVE_BATCH_SIZE)]
+            responses = await asyncio.gather(*(self._send_batch('PATCH', [f"files/{file_id}" for file_id in chunk], body, params) for chunk in chunks), return_exceptions=True)
+            pending = []
+            for chunk, parts in zip(chunks, responses):
+                # Any other failure is kept per chunk too, so results Drive already returned for other chunks survive.
+                if isinstance(parts, Exception): parts = {i: (500, json.dumps({'error': {'message': str(parts)}}).encode()) for i in range(len(chunk))}
+                for i, file_id in enumerate(chunk):
+                    status, content = parts.get(i, (500, b''))
+                    rate_limited = status == 429 or (status == 403 and b'ateLimitExceeded' in content)
+                    if (rate_limited or status >= 500) and attempt < DRIVE_MAX_RETRIES: pending.append(file_id); continue
+                    errors[file_id] = HttpError(httplib2.Response({'status': status}), content, uri=f"{DRIVE_API_URL}/files/{file_id}") if status >= 400 else None
+            if not pending: return errors
+            await asyncio.sleep(min(2 ** attempt, 32) + random.random())
+        return errors
+
+    async def trash(self, file_ids):
+        return await self.batch_update(file_ids, {'trashed': True}, supportsAllDrives=True, fields='id')
+
+    async def untrash(self, file_ids):
+        return await self.batch_update(file_ids, {'trashed': False}, supportsAllDrives=True, fields='id')
+
+    async def _download(self, path, params, sink, on_bytes=None):
+        for attempt in range(DRIVE_MAX_RETRIES + 1):
+            await self.scheduler.acquire(self.user, self.priority); auth = await self._auth_headers()
+            sink.seek(0); sink.truncate()
+            async with self.semaphore:
+                async with self.http.stream('GET', f"{DRIVE_API_URL}/{path}", params=params, headers=auth) as resp:
+                    if resp.status_code < 400:
+                        async for block in resp.aiter_bytes(1024 * 1024):
+                            sink.write(block)
+                            if on_bytes: on_bytes(len(block))
+                        return
+                    await resp.aread()
+            rate_limited = resp.status_code == 429 or (resp.status_code == 403 and b'ateLimitExceeded' in resp.content)
+            if (rate_limited or resp.status_code >= 500) and attempt < DRIVE_MAX_RETRIES:
+                await asyncio.sleep(min(2 ** attempt, 32) + random.random()); continue
+            self.raise_for_status(resp)
+
+    async def get_media(self, fileId, sink, on_bytes=None, **params):
+        await self._download(f"files/{fileId}", {'alt': 'media', **params}, sink, on_bytes)
+
+    async def export(self, fileId, mimeType, sink, on_bytes=None):
+        await self._download(f"files/{fileId}/export", {'mimeType': mimeType}, sink, on_bytes)
+
+    async def create_upload_session(self, body, mime_type, size, **params):
+        resp = await self._send('POST', f"{DRIVE_UPLOAD_URL}/files", params={'uploadType': 'resumable', **params}, json=body, headers={'X-Upload-Content-Type': mime_type, 'X-Upload-Content-Length': str(size)})
+        self.raise_for_status(resp)
+        return resp.headers['Location']
+
+    async def upload_chunk(self, session_url, chunk, offset, total):
+        # Chunks are not retried blindly: after a failure the caller asks the session how much it has and resumes there.
+        content_range = f"bytes {offset}-{offset + len(chunk) - 1}/{total}" if chunk else f"bytes */{total}"
+        return await self._send('PUT', session_url, content=chunk, headers={'Content-Range': content_range}, retry=False)
+
+    async def query_upload_status(self, session_url, total):
+        return await self._send('PUT', session_url, content=b'', headers={'Content-Range': f"bytes */{total}"}, retry=False)
+
+def get_async_drive_client(user_email):
+    creds = Credentials.from_authorized_user_info(json.loads(st.session_state.google_creds))
+    # Refreshes happen on the loop thread, which has no script context; write back through this session's own state.
+    session_state = get_script_run_ctx().session_state
+    def persist_credentials(refreshed): session_state['google_creds'] = refreshed.to_json()
+    return AsyncDriveClient(creds, user_email, on_refresh=persist_credentials)
+
+async def crawl_folder_tree(client, root_id, root_name, fields, path_key='path', page_size=200):
+    # Each folder level is listed concurrently; results are stitched back into depth-first order.
+    warnings = []
+    async def walk(f_id, path_prefix):
+        try: children = await client.list_all(q=f"'{f_id}' in parents and trashed=false", fields=f"nextPageToken, files({fields})", supportsAllDrives=True, includeItemsFromAllDrives=True, pageSize=page_size)
+        except HttpError as e: warnings.append(f"Could not access folder: {e}"); return []
+        async def no_children(): return []
+        subtrees = await asyncio.gather(*(walk(item['id'], os.path.join(path_prefix, item['name'])) if item['mimeType'] == 'application/vnd.google-apps.folder' else no_children() for item in children))
+        ordered = []
+        for item, subtree in zip(children, subtrees):
+            item[path_key] = os.path.join(path_prefix, item['name']); ordered.append(item); ordered.extend(subtree)
+        return ordered
+    return await walk(root_id, root_name), warnings
+
 # --- HELPER & FEATURE FUNCTIONS ---
 def extract_file_id_from_link(link):
     if not link: return None
@@ -179,58 +524,87 @@ def get_file_icon(item):
     if mime_type.startswith('video/'): return '🎞️'
     return icon_map.get(mime_type, '📄')
 
-@st.cache_data(ttl=600)
-def get_drive_snapshot_data(_service, user_email):
-    try:
-        results = _service.files().list(
-            q="trashed=false and mimeType != 'application/vnd.google-apps.folder'",
-            pageSize=1000,
-            orderBy='modifiedTime desc',
-            fields="files(id, name, mimeType, quotaBytesUsed, modifiedTime, owners, webViewLink)"
-        ).execute()
-        files = results.get('files', [])
-
-        if not files:
-            return None, "No files found to analyze."
+def get_file_category(mime_type):
+    if 'google-apps.document' in mime_type or 'wordprocessingml' in mime_type: return 'Documents'
+    if 'google-apps.spreadsheet' in mime_type or 'spreadsheetml' in mime_type: return 'Spreadsheets'
+    if 'google-apps.presentation' in mime_type or 'presentationml' in mime_type: return 'Presentations'
+    if 'pdf' in mime_type: return 'PDFs'
+    if mime_type.startswith('image/'): return 'Images'
+    if mime_type.startswith('video/'): return 'Videos'
+    if 'zip' in mime_type or 'archive' in mime_type: return 'Archives'
+    return 'Other'
 
-        # Process files for stats
-        storage_by_type = defaultdict(int)
-        ownership_counts = Counter()
-        
-        def get_category(mime_type):
-            if 'google-apps.document' in mime_type or 'wordprocessingml' in mime_type: return 'Documents'
-            if 'google-apps.spreadsheet' in mime_type or 'spreadsheetml' in mime_type: return 'Spreadsheets'
-            if 'google-apps.presentation' in mime_type or 'presentationml' in mime_type: return 'Presentations'
-            if 'pdf' in mime_type: return 'PDFs'
-            if mime_type.startswith('image/'): return 'Images'
-            if mime_type.startswith('video/'): return 'Videos'
-            if 'zip' in mime_type or 'archive' in mime_type: return 'Archives'
-            return 'Other'
+def snapshot_partitions(now=None):
+    # Half-open modifiedTime ranges that tile the whole timeline, so every file lands in exactly one partition.
+    # Boundaries get denser towards the present, where most files are.
+    now = now or pd.Timestamp.now(tz='UTC')
+    edges = [(now - pd.Timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S') for days in SNAPSHOT_PARTITION_AGE_DAYS]
+    lower_bounds, upper_bounds = [None] + edges[::-1], edges[::-1] + [None]
+    return [' and '.join(clause for clause in (f"modifiedTime >= '{lo}'" if lo else '', f"modifiedTime < '{hi}'" if hi else '') if clause) for lo, hi in zip(lower_bounds, upper_bounds)]
+
+class SnapshotAggregate:
+    # Partial statistics for one partition; merging partials is exact because the scan aggregates each file id only once.
+    __slots__ = ('storage_by_type', 'ownership_counts', 'largest_files', 'oldest_files', 'total_files_analyzed')
+    TOP_K = 10
+
+    def __init__(self):
+        self.storage_by_type, self.ownership_counts = Counter(), Counter()
+        self.largest_files, self.oldest_files, self.total_files_analyzed = [], [], 0
 
+    def add_files(self, files, user_email):
         for f in files:
-            size = int(f.get('quotaBytesUsed', 0))
-            category = get_category(f.get('mimeType', ''))
-            storage_by_type[category] += size
-            
-            owner_email = f.get('owners', [{}])[0].get('emailAddress', '')
-            if owner_email == user_email:
-                ownership_counts['Owned by Me'] += 1
-            else:
-                ownership_counts['Shared with Me'] += 1
+            self.storage_by_type[get_file_category(f.get('mimeType', ''))] += int(f.get('quotaBytesUsed', 0))
+            owner_email = (f.get('owners') or [{}])[0].get('emailAddress', '')
+            self.ownership_counts['Owned by Me' if owner_email == user_email else 'Shared with Me'] += 1
+        self.total_files_analyzed += len(files)
+        self._keep_top(files, files)
+        return self
 
-        # Sort by size for largest files and by time for oldest
-        files.sort(key=lambda x: int(x.get('quotaBytesUsed', 0)), reverse=True)
-        largest_files = files[:10]
+    def _keep_top(self, largest_candidates, oldest_candidates):
+        self.largest_files = heapq.nlargest(self.TOP_K, self.largest_files + largest_candidates, key=lambda x: int(x.get('quotaBytesUsed', 0)))
+        self.oldest_files = heapq.nsmallest(self.TOP_K, self.oldest_files + oldest_candidates, key=lambda x: x.get('modifiedTime', ''))
 
-        files.sort(key=lambda x: x.get('modifiedTime'))
-        oldest_files = files[:10]
+    def merge(self, other):
+        self.storage_by_type.update(other.storage_by_type); self.ownership_counts.update(other.ownership_counts)
+        self.total_files_analyzed += other.total_files_analyzed
+        self._keep_top(other.largest_files, other.oldest_files)
+        return self
+
+async def scan_drive_partition(client, partition_q, user_email, search_index, seen_ids):
+    # A file edited mid-scan moves into the newest range and can be listed twice; `seen_ids` (shared by every partition
+    # on the one loop thread) drops the repeat. It is still missed if it moves into a range already paged past.
+    aggregate, page_token = SnapshotAggregate(), None
+    while True:
+        results = await client.list(q=f"trashed=false and {partition_q}" if partition_q else "trashed=false", fields="nextPageToken, files(id, name, mimeType, quotaBytesUsed, modifiedTime, owners(emailAddress), webViewLink)", pageSize=1000, **({'pageToken': page_token} if page_token else {}))
+        items = results.get('files', [])
+        search_index.add_items(items)
+        new_items = [f for f in items if f['id'] not in seen_ids]; seen_ids.update(f['id'] for f in new_items)
+        aggregate.add_files([f for f in new_items if f.get('mimeType') != 'application/vnd.google-apps.folder'], user_email)
+        page_token = results.get('nextPageToken')
+        if not page_token: return aggregate
+
+@st.cache_data(ttl=SNAPSHOT_TTL_SECONDS)
+def get_drive_snapshot_data(_client, user_email):
+    try:
+        search_index = get_search_index(user_email)
+        async def scan():
+            seen_ids = set()
+            return await asyncio.gather(*(scan_drive_partition(_client, q, user_email, search_index, seen_ids) for q in snapshot_partitions()))
+        partials = run_async(scan())
+        totals = SnapshotAggregate()
+        for partial in partials: totals.merge(partial)
+        # Every partition was paged to the end, so until the snapshot expires the index has an entry for every item.
+        search_index.covered_at = time.monotonic()
+
+        if not totals.total_files_analyzed:
+            return None, "No files found to analyze."
 
         stats = {
-            'storage_by_type': dict(storage_by_type),
-            'ownership_counts': dict(ownership_counts),
-            'largest_files': largest_files,
-            'oldest_files': oldest_files,
-            'total_files_analyzed': len(files)
+            'storage_by_type': dict(totals.storage_by_type),
+            'ownership_counts': dict(totals.ownership_counts),
+            'largest_files': totals.largest_files,
+            'oldest_files': totals.oldest_files,
+            'total_files_analyzed': totals.total_files_analyzed
         }
         return stats, None
     except HttpError as e:
@@ -238,70 +612,55 @@ def get_drive_snapshot_data(_service, user_email):
     except Exception as e:
         return None, f"An unexpected error occurred: {e}"
 
-def get_file_details(_service, file_id):
-    try: return _service.files().get(fileId=file_id, fields='id, name, mimeType, size, webViewLink, modifiedTime, owners, shortcutDetails, capabilities', supportsAllDrives=True).execute()
+FILE_DETAIL_FIELDS = 'id, name, mimeType, size, webViewLink, modifiedTime, owners, shortcutDetails, capabilities'
+
+def get_file_details(client, file_id):
+    try: return run_async(client.get(file_id, fields=FILE_DETAIL_FIELDS, supportsAllDrives=True))
     except Exception: return None
 
-def list_folder_contents(service, folder_id):
-    all_items, total_size = [], 0; root_details = get_file_details(service, folder_id)
+def list_folder_contents(client, folder_id):
+    root_details = get_file_details(client, folder_id)
     if not root_details: return [], 0
-    def recurse(s, f_id, path_prefix):
-        nonlocal total_size; page_token = None
-        while True:
-            try: results = s.files().list(q=f"'{f_id}' in parents and trashed=false", fields="nextPageToken, files(id, name, mimeType, size, webViewLink, capabilities, owners, modifiedTime)", supportsAllDrives=True, includeItemsFromAllDrives=True, pageSize=100, pageToken=page_token).execute()
-            except HttpError as e: st.warning(f"Could not access folder: {e}"); break
-            for item in results.get('files', []):
-                path = os.path.join(path_prefix, item['name']); size = int(item.get('size', 0)); total_size += size; all_items.append({**item, 'Path': path})
-                if item['mimeType'] == 'application/vnd.google-apps.folder': recurse(s, item['id'], path)
-            page_token = results.get('nextPageToken')
-            if not page_token: break
-    recurse(service, folder_id, root_details['name']); return all_items, total_size
+    all_items, warnings = run_async(crawl_folder_tree(client, folder_id, root_details['name'], "id, name, mimeType, size, webViewLink, capabilities, owners, modifiedTime", path_key='Path', page_size=100))
+    for warning in warnings: st.warning(warning)
+    index_crawl(client.user, root_details, all_items, 'Path')
+    return all_items, sum(int(item.get('size', 0)) for item in all_items)
 
-def get_owner_and_all_items_recursive(_service, file_id):
-    root_details = get_file_details(_service, file_id)
+def get_owner_and_all_items_recursive(client, file_id):
+    root_details = get_file_details(client, file_id)
     if not root_details: return None, []
     all_items = []
-    def recurse(f_id, path_list):
-        page_token = None
-        while True:
-            try:
-                fields_to_get = "nextPageToken, files(id, name, mimeType, webViewLink, capabilities, owners, modifiedTime, size)"; results = _service.files().list(q=f"'{f_id}' in parents and trashed=false", fields=fields_to_get, supportsAllDrives=True, includeItemsFromAllDrives=True, pageSize=200, pageToken=page_token).execute()
-                for item in results.get('files', []):
-                    current_path = path_list + [item['name']]; item['path'] = os.path.join(*current_path); all_items.append(item)
-                    if item['mimeType'] == 'application/vnd.google-apps.folder': recurse(item['id'], current_path)
-                page_token = results.get('nextPageToken')
-                if not page_token: break
-            except HttpError as e: st.warning(f"Could not access subfolder content: {e}"); break
-    if root_details.get('mimeType') == 'application/vnd.google-apps.folder': recurse(file_id, [root_details.get('name', 'Root')])
+    if root_details.get('mimeType') == 'application/vnd.google-apps.folder':
+        all_items, warnings = run_async(crawl_folder_tree(client, file_id, root_details.get('name', 'Root'), "id, name, mimeType, webViewLink, capabilities, owners, modifiedTime, size"))
+        for warning in warnings: st.warning(f"Could not access subfolder content: {warning}")
+    index_crawl(client.user, root_details, all_items, 'path')
     return root_details, all_items
 
 @st.cache_data(ttl=600)
-def get_user_folders(_service):
-    folders = []; page_token = None
-    while True:
-        try:
-            results = _service.files().list(q="mimeType='application/vnd.google-apps.folder' and 'root' in parents and trashed=false", fields="nextPageToken, files(id, name)", pageSize=200, pageToken=page_token).execute()
-            folders.extend(results.get('files', [])); page_token = results.get('nextPageToken')
-            if not page_token: break
-        except Exception as e: raise e
-    return folders
+def get_child_folders(_client, user_email, parent_id, name_filter='', page_token=None):
+    # One page of a folder's subfolders; a filter becomes a Drive name query instead of a scan of the whole level.
+    escaped = name_filter.replace('\\', '\\\\').replace("'", "\\'")
+    q = f"mimeType='application/vnd.google-apps.folder' and '{parent_id}' in parents and trashed=false" + (f" and name contains '{escaped}'" if name_filter else "")
+    results = run_async(_client.list(q=q, fields="nextPageToken, files(id, name)", orderBy='name', pageSize=DEST_PICKER_PAGE_SIZE, supportsAllDrives=True, includeItemsFromAllDrives=True, **({'pageToken': page_token} if page_token else {})))
+    return results.get('files', []), results.get('nextPageToken')
 
 @st.cache_data(ttl=300)
-def get_and_sort_folder_items(_service, folder_id, current_user_email):
-    items, page_token = [], None
-    while True:
-        try:
-            fields = "nextPageToken, files(id, name, mimeType, size, webViewLink, modifiedTime, owners, shortcutDetails, capabilities)"; results = _service.files().list(q=f"'{folder_id}' in parents and trashed=false", fields=fields, pageSize=500, pageToken=page_token, supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-            items.extend(results.get('files', [])); page_token = results.get('nextPageToken')
-            if not page_token: break
-        except Exception as e: st.error(f"Failed to fetch Drive items: {e}"); break
+def get_and_sort_folder_items(_client, folder_id, current_user_email):
+    async def fetch():
+        items = await _client.list_all(q=f"'{folder_id}' in parents and trashed=false", fields=f"nextPageToken, files({FILE_DETAIL_FIELDS})", pageSize=500, supportsAllDrives=True, includeItemsFromAllDrives=True)
+        async def resolve(target_id):
+            try: return await _client.get(target_id, fields=FILE_DETAIL_FIELDS, supportsAllDrives=True)
+            except Exception: return None
+        target_ids = {item.get('shortcutDetails', {}).get('targetId') for item in items if item.get('mimeType') == 'application/vnd.google-apps.shortcut'} - {None}
+        targets = dict(zip(target_ids, await asyncio.gather(*(resolve(t) for t in target_ids))))
+        return items, targets
+    try: items, targets = run_async(fetch())
+    except Exception as e: st.error(f"Failed to fetch Drive items: {e}"); items, targets = [], {}
     processed_items = []
     for item in items:
         is_shortcut = item.get('mimeType') == 'application/vnd.google-apps.shortcut'; effective_mime, effective_owners = item.get('mimeType'), item.get('owners')
         if is_shortcut:
-            target_id = item.get('shortcutDetails', {}).get('targetId')
-            if not target_id: continue
-            target_details = get_file_details(_service, target_id)
+            target_details = targets.get(item.get('shortcutDetails', {}).get('targetId'))
             if not target_details: continue
             effective_mime, effective_owners = target_details.get('mimeType'), target_details.get('owners')
         is_folder = effective_mime == 'application/vnd.google-apps.folder'; owner_email = effective_owners[0].get('emailAddress', '') if effective_owners else ''; is_owned_by_me = owner_email == current_user_email
@@ -309,8 +668,8 @@ def get_and_sort_folder_items(_service, folder_id, current_user_email):
         processed_items.append(item)
     processed_items.sort(key=lambda x: (x['is_folder_sort'], x['is_owned_by_me_sort'], x['name_sort'])); return processed_items
 
-def analyze_content(all_items):
-    promo_keywords = ['subscribe', 'join', 'channel', 'promo', 'telegram', 'read', 'watch']; names = [item['name'] for item in all_items]; name_counts = Counter(names); repeated_names = {name for name, count in name_counts.items() if count > 1}
+def analyze_content(names):
+    promo_keywords = ['subscribe', 'join', 'channel', 'promo', 'telegram', 'read', 'watch']; name_counts = Counter(names); repeated_names = {name for name, count in name_counts.items() if count > 1}
     suggested_promo_files = set()
     for name in repeated_names:
         if any(keyword in name.lower() for keyword in promo_keywords): suggested_promo_files.add(name)
@@ -318,6 +677,43 @@ def analyze_content(all_items):
     if len(common_text) < 3 or not any(char.isalnum() for char in common_text): common_text = ""
     return common_text, list(suggested_promo_files)
 
+def apply_name_changes(names, tag_to_remove, tag_to_add):
+    new_names = names.str.replace(tag_to_remove, '', regex=False).str.strip() if tag_to_remove else names
+    if tag_to_add:
+        # Same split as os.path.splitext: the extension is the last dot-suffix, leading dots belong to the stem.
+        parts = new_names.str.extract(r'^(\.*[^.].*?)(\.[^.]*)?$', flags=re.S)
+        new_names = parts[0].fillna(new_names) + f" {tag_to_add}" + parts[1].fillna('')
+    return new_names
+
+def plan_cleaner_operations(df, can_edit_directly):
+    # Resolves every row to the single API operation it needs (or none) before anything runs.
+    selected = df['Select'] if df['Select'].any() else pd.Series(True, index=df.index)
+    if can_edit_directly:
+        operation = np.select([selected & df['Action'].eq('Trash'), selected & df['Action'].eq('Rename') & df['Name'].ne(df['New_Name'])], ['trash', 'rename'], default='noop')
+    else:
+        is_copy = selected & df['Action'].eq('Copy')
+        operation = np.select([is_copy & df['canCopy'].eq(True), is_copy], ['copy', 'blocked'], default='noop')
+    plan = df.assign(Selected=selected, Operation=operation)
+    # Renamed files collide with any surviving sibling of the same final name; copies all land in one folder.
+    final_names = plan['New_Name'].where(plan['Operation'].isin(['rename', 'copy']), plan['Name'])
+    survivors = plan['Operation'].ne('trash') if can_edit_directly else plan['Operation'].eq('copy')
+    parents = plan['Path'].map(os.path.dirname) if can_edit_directly else ''
+    keys = pd.DataFrame({'parent': parents, 'name': final_names})[survivors]
+    plan['Collision'] = keys.duplicated(keep=False).reindex(plan.index, fill_value=False) & plan['Operation'].isin(['rename', 'copy'])
+    return plan
+
+def summarize_plan(plan, can_edit_directly):
+    counts = plan.loc[plan['Selected'], 'Operation'].value_counts()
+    # Trash parts share batch requests, but every part still counts against quota.
+    api_calls = int(counts.reindex(['rename', 'trash', 'copy'], fill_value=0).sum()) + (0 if can_edit_directly else 1)
+    return {
+        'counts': {op: int(counts.get(op, 0)) for op in ['rename', 'trash', 'copy', 'noop', 'blocked']},
+        'collisions': int(plan['Collision'].sum()), 'api_calls': api_calls,
+        # Calls are admitted at the per-user rate and run concurrently, so a job lasts about as long as admitting every call
+        # plus one round trip per sequential stage: the destination folder is created before any copy starts.
+        'estimated_seconds': api_calls / DRIVE_USER_RATE + PLAN_SECONDS_PER_CALL * ((1 if api_calls else 0) + (0 if can_edit_directly else 1)),
+    }
+
 def generate_excel_report(dataframes_dict, filename="report.xlsx"):
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -332,12 +728,59 @@ def generate_excel_report(dataframes_dict, filename="report.xlsx"):
                         if cell.value and 'http' in cell.value: cell.hyperlink, cell.style = cell.value, "Hyperlink"
     return output.getvalue(), filename
 
-def create_standard_dataframe(items_list, select_status=False):
-    processed_content = []
-    for item in items_list:
-        owner_name = item.get('owners', [{}])[0].get('displayName', 'N/A'); mod_time = pd.to_datetime(item.get('modifiedTime')).strftime('%Y-%m-%d %H:%M') if item.get('modifiedTime') else 'N/A'; size_mb = float(f"{int(item.get('size', 0)) / (1024*1024):.2f}") if 'size' in item and item['size'] is not None else 0.0
-        processed_content.append({**item, 'Select': select_status, 'Name': item.get('name', 'N/A'), 'Type': 'Folder' if item.get('mimeType') == 'application/vnd.google-apps.folder' else 'File', 'Size (MB)': size_mb, 'Modified': mod_time, 'Owner': owner_name, 'Link': item.get('webViewLink', '#'), 'Path': item.get('Path', item.get('name'))})
-    return pd.DataFrame(processed_content)
+class CrawlStore:
+    # Columnar, de-duplicated form of a crawl. Sessions keep one of these instead of item dicts and DataFrame copies;
+    # DataFrames are built on demand and owner/mime strings are interned so repeated values share one object.
+    __slots__ = ('ids', 'names', 'mime_types', 'sizes', 'modified', 'owner_names', 'owner_emails', 'links', 'paths', 'can_copy')
+    INTERNED = ('mime_types', 'owner_names', 'owner_emails')
+
+    @classmethod
+    def from_items(cls, items, path_key='Path'):
+        store = cls()
+        owners = [(item.get('owners') or [{}])[0] for item in items]
+        store.ids = [item['id'] for item in items]
+        store.names = [item.get('name', 'N/A') for item in items]
+        store.mime_types = [sys.intern(item.get('mimeType', '')) for item in items]
+        store.sizes = np.array([int(item.get('size') or 0) for item in items], dtype=np.int64)
+        store.modified = pd.to_datetime(pd.Series([item.get('modifiedTime') for item in items], dtype=object), utc=True, errors='coerce').dt.tz_localize(None).to_numpy()  # naive UTC datetime64, not per-row Timestamp objects
+        store.owner_names = [sys.intern(owner.get('displayName', 'N/A')) for owner in owners]
+        store.owner_emails = [sys.intern(owner.get('emailAddress', '')) for owner in owners]
+        store.links = [item.get('webViewLink', '#') for item in items]
+        store.paths = [item.get(path_key, name) for item, name in zip(items, store.names)]
+        store.can_copy = [(item.get('capabilities') or {}).get('canCopy') for item in items]
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_dataframe(self, select_status=False):
+        if not len(self): return pd.DataFrame()
+        modified = pd.Series(self.modified).dt.strftime('%Y-%m-%d %H:%M').fillna('N/A')
+        return pd.DataFrame({
+            'Select': select_status, 'Name': self.names,
+            'Type': np.where(np.array(self.mime_types, dtype=object) == 'application/vnd.google-apps.folder', 'Folder', 'File'),
+            'Size (MB)': np.round(self.sizes / (1024*1024), 2), 'Modified': modified, 'Owner': self.owner_names,
+            'Link': self.links, 'Path': self.paths, 'id': self.ids, 'mimeType': self.mime_types, 'canCopy': self.can_copy,
+        })
+
+    def nbytes(self):
+        total = 0
+        for column in self.__slots__:
+            values = getattr(self, column)
+            if isinstance(values, np.ndarray) and values.dtype != object: total += values.nbytes; continue
+            shared = set(values) if column in self.INTERNED else values
+            total += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in shared)
+        return total
+
+def estimate_nbytes(value):
+    if isinstance(value, CrawlStore): return value.nbytes()
+    if isinstance(value, pd.DataFrame): return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (list, tuple)): return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, dict): return sys.getsizeof(value) + sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+def get_session_memory_footprint():
+    return {key: estimate_nbytes(value) for key, value in st.session_state.items()}
 
 def create_explorer_dataframe(items_list):
     processed_content = []
@@ -355,12 +798,348 @@ def create_explorer_dataframe(items_list):
         })
     return pd.DataFrame(processed_content)
 
+# --- TRANSFERS ---
+
+class TransferProgress:
+    # Byte counters written from the event loop and read by the script thread that renders the progress bar.
+    def __init__(self, total_bytes):
+        self.total_bytes, self.done_bytes, self.started = total_bytes, 0, time.time()
+        self._lock = threading.Lock()
+
+    def advance(self, nbytes):
+        with self._lock: self.done_bytes += nbytes
+
+    @property
+    def fraction(self):
+        return min(self.done_bytes / self.total_bytes, 1.0) if self.total_bytes else 0.0
+
+    def render_text(self, label):
+        rate = self.done_bytes / max(time.time() - self.started, 1e-6)
+        eta = f"{(self.total_bytes - self.done_bytes) / rate:.0f}s" if rate > 0 else "--"
+        return f"{label}: {format_storage(self.done_bytes)} of {format_storage(self.total_bytes)} · {format_storage(rate)}/s · ETA {eta}"
+
+def wait_with_progress(future, progress, progress_bar, label):
+    while not future.done():
+        progress_bar.progress(progress.fraction, text=progress.render_text(label))
+        concurrent.futures.wait([future], timeout=0.5)
+    progress_bar.progress(1.0, text=progress.render_text(label))
+    return future.result()
+
+def parse_upload_offset(resp):
+    match = re.match(r'bytes=\d+-(\d+)', resp.headers.get('Range', ''))
+    return int(match.group(1)) + 1 if match else 0
+
+async def resumable_upload(client, file_obj, name, mime_type, size, parent_id, progress):
+    session_url = await client.create_upload_session({'name': name, 'parents': [parent_id]}, mime_type, size, fields='id, name, mimeType, size, webViewLink', supportsAllDrives=True)
+    offset, failures = 0, 0
+    while True:
+        file_obj.seek(offset); chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+        try: resp = await client.upload_chunk(session_url, chunk, offset, size)
+        except httpx.TransportError: resp = None
+        if resp is not None and resp.status_code in (200, 201): progress.advance(size - offset); return resp.json()
+        if resp is not None and resp.status_code == 308:
+            new_offset = parse_upload_offset(resp); progress.advance(new_offset - offset); offset, failures = new_offset, 0; continue
+        if resp is not None and resp.status_code < 500 and resp.status_code not in (408, 429): client.raise_for_status(resp)
+        # Interrupted or server-side failure: back off, then resume from whatever the session has persisted.
+        failures += 1
+        if failures > UPLOAD_MAX_CHUNK_FAILURES:
+            if resp is not None: client.raise_for_status(resp)
+            raise ConnectionError(f"Upload of '{name}' was interrupted too many times.")
+        await asyncio.sleep(min(2 ** failures, 32) + random.random())
+        try: status = await client.query_upload_status(session_url, size)
+        except httpx.TransportError: continue
+        if status.status_code in (200, 201): progress.advance(size - offset); return status.json()
+        if status.status_code == 308: new_offset = parse_upload_offset(status); progress.advance(new_offset - offset); offset = new_offset
+
+async def upload_files(client, uploads, parent_id, progress):
+    limiter = asyncio.Semaphore(UPLOAD_PARALLEL_FILES)
+    async def upload_one(file_obj, name, mime_type, size):
+        async with limiter: return await resumable_upload(client, file_obj, name, mime_type, size, parent_id, progress)
+    return await asyncio.gather(*(upload_one(*upload) for upload in uploads), return_exceptions=True)
+
+def safe_zip_path(path, name):
+    # Shared folders are untrusted and Drive names may contain "/", "\\", "." or "..". Separators inside the item's own
+    # name are replaced and empty, "." and ".." segments are dropped, so no entry can point outside the archive root.
+    prefix = path[:-len(name)] if name and path.endswith(name) else path
+    leaf = re.sub(r'[\\/]', '_', name)
+    return '/'.join([part for part in re.split(r'[\\/]+', prefix) if part not in ('', '.', '..')] + [leaf if leaf.strip('.') else '_'])
+
+def plan_zip_entries(store):
+    # Keeps the crawler's folder paths as archive names; Drive allows duplicate names, zip entries should not.
+    seen, folders, files = set(), [], []
+    for file_id, mime_type, path, name in zip(store.ids, store.mime_types, store.paths, store.names):
+        path = safe_zip_path(path, name)
+        if mime_type == 'application/vnd.google-apps.folder': folders.append(path + '/'); continue
+        if mime_type.startswith('application/vnd.google-apps.') and mime_type not in EXPORT_FORMATS: continue
+        stem, ext = os.path.splitext(path); ext += EXPORT_FORMATS[mime_type][1] if mime_type in EXPORT_FORMATS else ''
+        arcname, n = stem + ext, 1
+        while arcname in seen: arcname, n = f"{stem} ({n}){ext}", n + 1
+        seen.add(arcname); files.append((file_id, mime_type, arcname))
+    return folders, files
+
+async def build_folder_zip(client, store, zip_path, progress):
+    # Downloads run concurrently into spooled temp files; a single writer appends finished ones to the archive,
+    # so memory is bounded by the number of in-flight files, not the archive size.
+    folders, files = plan_zip_entries(store)
+    finished, limiter, skipped = asyncio.Queue(maxsize=DOWNLOAD_PARALLEL_FILES), asyncio.Semaphore(DOWNLOAD_PARALLEL_FILES), []
+    async def fetch(file_id, mime_type, arcname):
+        async with limiter:
+            spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+            try:
+                if mime_type in EXPORT_FORMATS: await client.export(file_id, EXPORT_FORMATS[mime_type][0], spool, progress.advance)
+                else: await client.get_media(file_id, spool, progress.advance, supportsAllDrives=True)
+            except (HttpError, httpx.TransportError) as e: spool.close(); skipped.append({'Name': arcname, 'Reason': getattr(e, 'reason', str(e))}); return
+            except BaseException: spool.close(); raise
+            await finished.put((arcname, spool))
+    def write_entry(archive, arcname, spool):
+        spool.seek(0)
+        with spool, archive.open(arcname, 'w', force_zip64=True) as dest: shutil.copyfileobj(spool, dest, 1024 * 1024)
+    async def writer(archive):
+        error = None
+        while (entry := await finished.get()) is not None:
+            # After a write error keep draining so fetchers blocked on the queue can finish.
+            if error: entry[1].close(); continue
+            try: await asyncio.to_thread(write_entry, archive, *entry)
+            except Exception as e: error = e
+        if error: raise error
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for folder in folders: archive.writestr(folder, '')
+        writer_task = asyncio.create_task(writer(archive))
+        # The sentinel must go out even if a fetch fails unexpectedly (e.g. a spool spilling to a full disk); otherwise the
+        # writer waits forever on the shared loop and the archive closes under a write still running in its thread.
+        fetches = [asyncio.create_task(fetch(*entry)) for entry in files]
+        try: await asyncio.gather(*fetches)
+        finally:
+            for task in fetches: task.cancel()
+            await asyncio.gather(*fetches, return_exceptions=True)
+            await finished.put(None); await writer_task
+    return skipped
+
+# --- SEARCH INDEX ---
+
+def tokenize_name(text):
+    return re.findall(r'[^\W_]+', text.lower())
+
+def drive_link(file_id, mime_type):
+    return f"https://drive.google.com/drive/folders/{file_id}" if mime_type == 'application/vnd.google-apps.folder' else f"https://drive.google.com/open?id={file_id}"
+
+class NameSearchIndex:
+    # Inverted index over names and folder paths. Docs are append-only columns; name and path tokens map to ascending
+    # array('I') postings with a sorted vocabulary (re-sorted lazily after new tokens) for bisect prefix lookups.
+    # Replaced or removed docs are only marked dead and skipped by queries until enough pile up to rebuild.
+    FIELDS = ('name', 'path')
+    COMPACT_MIN_DEAD = 10000
+
+    def __init__(self):
+        self._reset()
+        self.indexed_folders = set()
+        self.covered_at = None
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self.doc_by_id, self.ids, self.names, self.folders, self.mime_types, self.name_tokens = {}, [], [], [], [], []
+        self.name_lengths = array('H')
+        self.folder_tokens = {}  # interned folder path -> its tokens, shared by every sibling
+        self.postings = {field: {} for field in self.FIELDS}
+        self.vocabulary = {field: [] for field in self.FIELDS}
+        self._vocabulary_stale = {field: False for field in self.FIELDS}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.doc_by_id)
+
+    @property
+    def covers_drive(self):
+        # Changes made outside this app only reach the index through a fresh snapshot, so coverage expires with it.
+        return self.covered_at is not None and time.monotonic() - self.covered_at < SNAPSHOT_TTL_SECONDS
+
+    def _kill(self, doc):
+        self.ids[doc] = None; self.dead += 1
+
+    def _add(self, item, path):
+        file_id, name, mime_type = item['id'], item.get('name', ''), item.get('mimeType', '')
+        old_doc = self.doc_by_id.get(file_id)
+        # Sources without paths (snapshot, name search, renames) keep the folder path learnt from a crawl.
+        folder = os.path.dirname(path) if path else (self.folders[old_doc] if old_doc is not None else '')
+        if old_doc is not None:
+            # Listings are re-indexed on every rerun; unchanged entries must not touch postings or the vocabulary.
+            if name == self.names[old_doc] and folder == self.folders[old_doc] and mime_type in ('', self.mime_types[old_doc]): return
+            mime_type = mime_type or self.mime_types[old_doc]; self._kill(old_doc)
+        folder = sys.intern(folder)
+        if folder not in self.folder_tokens:
+            # The "My Drive" root prefixes every explorer path, so its tokens would match nearly every entry.
+            self.folder_tokens[folder] = tuple(sys.intern(t) for t in set(tokenize_name(folder[len('My Drive'):] if folder.startswith('My Drive') else folder)))
+        name_tokens = tuple(sys.intern(t) for t in set(tokenize_name(name)))
+        doc = len(self.ids); self.doc_by_id[file_id] = doc
+        self.ids.append(file_id); self.names.append(name); self.folders.append(folder); self.mime_types.append(sys.intern(mime_type))
+        self.name_tokens.append(name_tokens); self.name_lengths.append(min(len(name), 0xFFFF))
+        for field, tokens in (('name', name_tokens), ('path', [t for t in self.folder_tokens[folder] if t not in name_tokens])):
+            postings = self.postings[field]
+            for token in tokens:
+                if token not in postings: postings[token] = array('I'); self._vocabulary_stale[field] = True
+                postings[token].append(doc)
+
+    def _compact_if_needed(self):
+        if self.dead < max(self.COMPACT_MIN_DEAD, len(self.doc_by_id)): return
+        live = [(file_id, name, folder, mime_type) for file_id, name, folder, mime_type in zip(self.ids, self.names, self.folders, self.mime_types) if file_id is not None]
+        self._reset()
+        for file_id, name, folder, mime_type in live: self._add({'id': file_id, 'name': name, 'mimeType': mime_type}, os.path.join(folder, name) if folder else name)
+
+    def add_items(self, items, path_key='Path', folder_ids=()):
+        with self._lock:
+            for item in items: self._add(item, item.get(path_key))
+            self.indexed_folders.update(folder_ids); self._compact_if_needed()
+
+    def remove(self, file_id):
+        with self._lock:
+            if file_id in self.doc_by_id: self._kill(self.doc_by_id.pop(file_id)); self._compact_if_needed()
+
+    def rename(self, file_id, new_name):
+        with self._lock:
+            doc = self.doc_by_id.get(file_id)
+            if doc is None: return
+            self._add({'id': file_id, 'name': new_name, 'mimeType': self.mime_types[doc]}, None); self._compact_if_needed()
+
+    def _completions(self, field, token):
+        # Vocabulary tokens starting with `token`, exact match first, then shortest completions.
+        if self._vocabulary_stale[field]: self.vocabulary[field] = sorted(self.postings[field]); self._vocabulary_stale[field] = False
+        vocabulary = self.vocabulary[field]; start = bisect.bisect_left(vocabulary, token)
+        return sorted(itertools.takewhile(lambda vocab_token: vocab_token.startswith(token), itertools.islice(vocabulary, start, None)), key=len)
+
+    def _doc_tokens(self, doc, fields):
+        return self.name_tokens[doc] if len(fields) == 1 else self.name_tokens[doc] + self.folder_tokens[self.folders[doc]]
+
+    def search(self, query, limit=50):
+        tokens = list(dict.fromkeys(tokenize_name(query)))
+        if not tokens: return []
+        with self._lock:
+            completions = {(field, token): self._completions(field, token) for field in self.FIELDS for token in tokens}
+            results, seen = [], set()
+            # Name hits rank before path-only hits. Each tier walks the rarest token's completions shortest-first,
+            # ranks each completion's postings by name length, and stops as soon as `limit` results are found.
+            for fields in (('name',), self.FIELDS):
+                anchor = min(tokens, key=lambda token: sum(len(self.postings[field][c]) for field in fields for c in completions[(field, token)]))
+                others = [token for token in tokens if token != anchor]
+                for completion in sorted({c for field in fields for c in completions[(field, anchor)]}, key=len):
+                    batch = set().union(*(self.postings[field].get(completion, ()) for field in fields)) - seen
+                    if self.dead: batch = [doc for doc in batch if self.ids[doc] is not None]
+                    if others: batch = [doc for doc in batch if all(any(t.startswith(other) for t in self._doc_tokens(doc, fields)) for other in others)]
+                    best = heapq.nsmallest(limit - len(results), batch, key=self.name_lengths.__getitem__)
+                    results.extend(best); seen.update(best)
+                    if len(results) >= limit: break
+                if len(results) >= limit: break
+            return [{'id': self.ids[doc], 'name': self.names[doc], 'path': os.path.join(self.folders[doc], self.names[doc]) if self.folders[doc] else self.names[doc],
+                     'mimeType': self.mime_types[doc], 'webViewLink': drive_link(self.ids[doc], self.mime_types[doc])} for doc in results]
+
+@st.cache_resource
+def get_search_indexes():
+    return OrderedDict(), threading.Lock()
+
+def get_search_index(user_email):
+    # Indexes are shared across a user's sessions; idle ones are dropped and the process keeps a bounded number of
+    # entries across all of them, evicting the least recently used index first.
+    indexes, lock = get_search_indexes(); now = time.monotonic()
+    with lock:
+        index = indexes.pop(user_email, None) or NameSearchIndex(); index.last_used = now; indexes[user_email] = index
+        for email in [email for email, idx in indexes.items() if now - idx.last_used > SEARCH_INDEX_IDLE_SECONDS]: del indexes[email]
+        while len(indexes) > 1 and sum(len(idx) for idx in indexes.values()) > SEARCH_INDEX_MAX_ENTRIES: indexes.popitem(last=False)
+        return index
+
+def index_crawl(user_email, root_details, items, path_key):
+    folder_ids = [root_details['id']] + [item['id'] for item in items if item['mimeType'] == 'application/vnd.google-apps.folder']
+    get_search_index(user_email).add_items([root_details] + items, path_key, folder_ids=folder_ids)
+
+@st.cache_data(ttl=60)
+def search_drive_by_name(_client, user_email, query, limit=50):
+    escaped = query.replace('\\', '\\\\').replace("'", "\\'")
+    files = run_async(_client.list(q=f"name contains '{escaped}' and trashed=false", fields="files(id, name, mimeType, webViewLink)", pageSize=limit, supportsAllDrives=True, includeItemsFromAllDrives=True)).get('files', [])
+    get_search_index(user_email).add_items(files)
+    return files
+
+def render_destination_picker(client, key):
+    # Walks the folder tree one level at a time. Levels are fetched a page at a time and filters are sent to Drive,
+    # so a folder with thousands of subfolders never has to be listed in full.
+    path_key, pages_key, filter_key = f"{key}_dest_path", f"{key}_dest_pages", f"{key}_dest_filter"
+    if path_key not in st.session_state: st.session_state[path_key] = [{'name': 'My Drive', 'id': 'root'}]
+    path = st.session_state[path_key]
+    destination_line = st.empty()
+    filter_col, choice_col, open_col, up_col, refresh_col = st.columns([3, 4, 1, 1, 1])
+    with filter_col: name_filter = st.text_input("Filter subfolders", key=filter_key, placeholder="Start of a folder name...").strip()
+    scope = (path[-1]['id'], name_filter)
+    if st.session_state.get(pages_key, {}).get('scope') != scope: st.session_state[pages_key] = {'scope': scope, 'count': 1}
+    children, page_token = [], None
+    try:
+        for _ in range(st.session_state[pages_key]['count']):
+            page, page_token = get_child_folders(client, client.user, path[-1]['id'], name_filter, page_token); children += page
+            if not page_token: break
+    except HttpError as e: st.error(f"Failed to fetch subfolders: {e}")
+    names = {folder['id']: folder['name'] for folder in children}
+    def open_choice(): path.append({'name': names[choice], 'id': choice}); st.session_state[filter_key] = ""
+    def go_up(): path.pop(); st.session_state[filter_key] = ""
+    def load_more(): st.session_state[pages_key]['count'] += 1
+    with choice_col: choice = st.selectbox("Subfolder", options=list(names), format_func=names.get, index=None, placeholder=f"{len(names)}{'+' if page_token else ''} subfolders", key=f"{key}_dest_choice_{path[-1]['id']}")
+    with open_col: st.markdown("</br>", unsafe_allow_html=True); st.button("➡️", key=f"{key}_dest_open", help="Open the selected subfolder", disabled=choice is None, on_click=open_choice, use_container_width=True)
+    with up_col: st.markdown("</br>", unsafe_allow_html=True); st.button("⬆️", key=f"{key}_dest_up", help="Go up one level", disabled=len(path) == 1, on_click=go_up, use_container_width=True)
+    with refresh_col: st.markdown("</br>", unsafe_allow_html=True); st.button("🔄", key=f"{key}_dest_refresh", help="Refresh folder list", on_click=get_child_folders.clear, use_container_width=True)
+    if page_token: st.button("Load more subfolders", key=f"{key}_dest_more", on_click=load_more)
+    # A highlighted subfolder is the destination even if it has not been opened.
+    destination = path + ([{'name': names[choice], 'id': choice}] if choice is not None else [])
+    destination_line.markdown(f"**Destination:** 📁 {' / '.join(folder['name'] for folder in destination)}")
+    return destination[-1]['id'], destination[-1]['name']
+
+def sweep_stale_files(directory):
+    os.makedirs(directory, exist_ok=True); cutoff = time.time() - DOWNLOAD_ZIP_MAX_AGE_SECONDS
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff: os.remove(entry.path)
+        except OSError: pass
+
+def new_download_zip_path():
+    # Sessions end without notice, so every new archive first sweeps archives and published links old enough to be abandoned.
+    sweep_stale_files(DOWNLOAD_ZIP_DIR); sweep_stale_files(APP_STATIC_ZIP_DIR)
+    return tempfile.NamedTemporaryFile(dir=DOWNLOAD_ZIP_DIR, suffix='.zip', delete=False).name
+
+def publish_download_zip(zip_path):
+    # Streamlit's app/static route streams files from disk, so the server never holds the archive in memory. The name is
+    # unguessable because the route has no auth; archives stay outside static/ until published, since Streamlit disables
+    # static serving at startup when that folder passes 1 GB.
+    os.makedirs(APP_STATIC_ZIP_DIR, exist_ok=True); target = os.path.join(APP_STATIC_ZIP_DIR, f"{secrets.token_urlsafe(24)}.zip")
+    try: os.link(zip_path, target)
+    except OSError: shutil.copyfile(zip_path, target)
+    return target
+
+def discard_download_zip():
+    st.session_state.pop('download_zip_skipped', None)
+    for key in ('download_zip_path', 'download_zip_static'):
+        path = st.session_state.pop(key, None)
+        if path and os.path.exists(path): os.remove(path)
+
 def reset_cleaner_state():
-    st.session_state.cleaner_state = 'initial'; st.session_state.cleaner_link = ""; st.session_state.cleaner_root_details = None; st.session_state.cleaner_all_items = []; st.session_state.cleaner_success_log = None; st.session_state.cleaner_skipped_log = None; st.session_state.cleaner_dest_folder_name = None
+    st.session_state.cleaner_state = 'initial'; st.session_state.cleaner_link = ""; st.session_state.cleaner_root_details = None; st.session_state.cleaner_contents = None; st.session_state.cleaner_log = None; st.session_state.cleaner_dest_folder_name = None
+
+def record_trash_job(label, items, errors):
+    # Undo log: one entry per job with the items Drive actually trashed, in the order they were trashed.
+    trashed = [item for item in items if errors.get(item['id']) is None]
+    if trashed: st.session_state.trash_jobs = (st.session_state.trash_jobs + [{'label': label, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'items': trashed}])[-TRASH_JOB_HISTORY:]
+    return trashed
+
+def restore_trash_job(client, search_index, job):
+    # Untrashes the job's whole log in concurrent batches. Each item's trashed flag is independent in Drive, so order does
+    # not matter; items that fail stay logged so they can be retried.
+    errors = run_async(client.untrash([item['id'] for item in job['items']]))
+    restored = [item for item in job['items'] if errors.get(item['id']) is None]
+    job['items'] = [item for item in job['items'] if errors.get(item['id']) is not None]
+    if not job['items']: st.session_state.trash_jobs.remove(job)
+    search_index.add_items(restored); get_and_sort_folder_items.clear()
+    return restored, [errors[item['id']] for item in job['items']]
 
 # --- MAIN APPLICATION UI ---
 
 def run_main_app(service, user_info):
+    client = get_async_drive_client(user_info['user_email'])
+    bulk_client = client.with_priority(PRIORITY_BULK)
+    search_index = get_search_index(user_info['user_email'])
     with st.sidebar:
         st.title(f"☁️ {APP_NAME}")
         st.caption("Your All-in-One G-Drive Hub")
@@ -377,6 +1156,26 @@ def run_main_app(service, user_info):
             st.session_state.page = selected_page
             st.rerun()
         st.info("Manage your Google Drive from one place.")
+        with st.expander("⏱️ API Queue"):
+            queue_stats = run_async(get_drive_scheduler().stats(user_info['user_email']))
+            for label in ('interactive', 'bulk'):
+                q = queue_stats[label]
+                st.caption(f"**{label.title()}:** {q['queue_depth']} queued ({q['user_queue_depth']} yours) · avg wait {q['avg_wait_ms']:.0f} ms · max {q['max_wait_ms']:.0f} ms")
+            st.caption(f"Users waiting: {queue_stats['active_users']}")
+        with st.expander("🧠 Session Memory"):
+            footprint = get_session_memory_footprint()
+            st.caption(f"**Total:** {format_storage(sum(footprint.values()))}")
+            for key, nbytes in sorted(footprint.items(), key=lambda kv: kv[1], reverse=True)[:5]: st.caption(f"{key}: {format_storage(nbytes)}")
+        with st.expander("♻️ Trash History"):
+            if not st.session_state.trash_jobs: st.caption("Nothing trashed in this session.")
+            for job_number, job in reversed(list(enumerate(st.session_state.trash_jobs))):
+                st.caption(f"**{job['label']}** · {len(job['items'])} items · {job['time']}")
+                if st.button("↩️ Restore", key=f"restore_job_{job_number}_{job['time']}", use_container_width=True):
+                    try:
+                        restored, failures = restore_trash_job(bulk_client, search_index, job)
+                        st.toast(f"Restored {len(restored)} items" + (f"; {len(failures)} failed ({failures[0].reason})" if failures else ""), icon="↩️")
+                    except Exception as e: st.toast(f"Restore failed: {e}", icon="⚠️")
+                    st.session_state.just_refreshed_explorer = True; st.rerun()
         st.write("---")
         
         col1, col2 = st.columns(2)
@@ -433,19 +1232,19 @@ def run_main_app(service, user_info):
         col1, col2 = st.columns([4, 1])
         with col1:
             st.subheader("🚀 Drive Activity Snapshot")
-            st.caption("This analysis is based on your 1,000 most recently modified files for a fast and relevant overview.")
+            st.caption(f"This analysis covers every file you can see, scanned in {len(SNAPSHOT_PARTITION_AGE_DAYS) + 1} parallel date ranges.")
         with col2:
             if st.button("🔄 Refresh Snapshot", help="Recalculate the drive snapshot."):
-                get_drive_snapshot_data.clear()
+                get_drive_snapshot_data.clear(); search_index.covered_at = None
                 st.session_state.snapshot_loaded = False
                 st.rerun()
 
         if not st.session_state.snapshot_loaded:
-            with st.spinner("Analyzing your recent drive activity..."):
+            with st.spinner("Scanning your whole drive..."):
                 start_time = time.time()
-                st.session_state.snapshot_stats, st.session_state.snapshot_error = get_drive_snapshot_data(service, user_info['user_email'])
+                st.session_state.snapshot_stats, st.session_state.snapshot_error = get_drive_snapshot_data(bulk_client, user_info['user_email'])
                 end_time = time.time()
-                st.session_state.last_operation_summary = f"✅ Snapshot loaded in {end_time - start_time:.2f}s."
+                st.session_state.last_operation_summary = f"✅ Snapshot of {(st.session_state.snapshot_stats or {}).get('total_files_analyzed', 0):,} files loaded in {end_time - start_time:.2f}s."
                 st.session_state.snapshot_loaded = True
                 st.rerun()
         
@@ -458,15 +1257,15 @@ def run_main_app(service, user_info):
         if error:
             st.error(error)
         elif not stats:
-            st.info("No recent file activity found to generate a snapshot.")
+            st.info("No files found to generate a snapshot.")
         else:
             tab1, tab2, tab3 = st.tabs(["📊 Storage Breakdown", "🐘 File Insights", "🤝 Ownership"])
 
             with tab1:
-                st.markdown("#### Storage by File Type (Recent Files)")
+                st.markdown("#### Storage by File Type")
                 storage_data = stats.get('storage_by_type', {})
                 if not storage_data:
-                    st.info("No files with size information found in the recent activity sample.")
+                    st.info("No files with size information found in your drive.")
                 else:
                     source = pd.DataFrame({
                         'Category': storage_data.keys(),
@@ -491,7 +1290,7 @@ def run_main_app(service, user_info):
                 c1, c2 = st.columns(2)
                 with c1:
                     with st.container(border=True):
-                        st.markdown("#### 🐘 Largest Files (Recent Sample)")
+                        st.markdown("#### 🐘 Largest Files")
                         largest_files = stats.get('largest_files', [])
                         if largest_files:
                             df_large = pd.DataFrame([{
@@ -504,7 +1303,7 @@ def run_main_app(service, user_info):
                             st.info("No files to display.")
                 with c2:
                     with st.container(border=True):
-                        st.markdown("#### ⏳ Oldest Modified Files (Recent Sample)")
+                        st.markdown("#### ⏳ Oldest Modified Files")
                         oldest_files = stats.get('oldest_files', [])
                         if oldest_files:
                             df_old = pd.DataFrame([{
@@ -517,10 +1316,10 @@ def run_main_app(service, user_info):
                             st.info("No files to display.")
             
             with tab3:
-                st.markdown("#### File Ownership (Recent Files)")
+                st.markdown("#### File Ownership")
                 ownership_data = stats.get('ownership_counts', {})
                 if not ownership_data:
-                    st.info("Could not determine ownership for recent files.")
+                    st.info("Could not determine ownership for your files.")
                 else:
                     source = pd.DataFrame({
                         'Category': ownership_data.keys(),
@@ -545,8 +1344,9 @@ def run_main_app(service, user_info):
     elif st.session_state.page == "File Explorer":
         if st.session_state.get('last_operation_summary'):
             st.success(st.session_state.pop('last_operation_summary'))
+        for failed_name, error in st.session_state.pop('upload_failures', []): st.error(f"Upload failed for '{failed_name}': {error}")
 
-        st.info("Directly browse, rename, and delete files and folders in your Google Drive.")
+        st.info("Directly browse, upload, rename, and delete files and folders in your Google Drive.")
         if not st.session_state.initial_fetch_done:
             st.markdown("<br>", unsafe_allow_html=True)
             c1, c2, c3 = st.columns([1,2,1])
@@ -580,8 +1380,10 @@ def run_main_app(service, user_info):
                                 st.rerun()
             
             current_folder_id = st.session_state.current_folder_id
-            items_to_display = get_and_sort_folder_items(service, current_folder_id, storage['user_email'])
+            items_to_display = get_and_sort_folder_items(client, current_folder_id, storage['user_email'])
             end_time = time.time()
+            breadcrumb_path = os.path.join(*[folder['name'] for folder in st.session_state.folder_path])
+            search_index.add_items([{**item, 'Path': os.path.join(breadcrumb_path, item['name'])} for item in items_to_display], folder_ids=[current_folder_id])
 
             if st.session_state.pop('just_refreshed_explorer', False):
                 st.session_state.last_operation_summary = f"✅ View loaded in {end_time - start_time:.2f}s."
@@ -607,6 +1409,37 @@ def run_main_app(service, user_info):
                         )
 
             st.markdown("---")
+            with st.expander(f"⬆️ Upload files to '{st.session_state.folder_path[-1]['name']}'"):
+                uploaded_files = st.file_uploader("Choose files", accept_multiple_files=True, key=f"explorer_uploader_{st.session_state.get('upload_widget_version', 0)}")
+                st.caption(f"Up to {st.get_option('server.maxUploadSize')} MB per file. Selected files are held in server memory until they are sent to Drive in {UPLOAD_CHUNK_SIZE // (1024*1024)} MB resumable chunks.")
+                if uploaded_files and st.button("🚀 Start Upload", key="start_upload"):
+                    uploads = [(f, f.name, f.type or mimetypes.guess_type(f.name)[0] or 'application/octet-stream', f.size) for f in uploaded_files]
+                    progress = TransferProgress(sum(upload[3] for upload in uploads)); progress_bar = st.progress(0, text="Starting upload...")
+                    results = wait_with_progress(submit_async(upload_files(bulk_client, uploads, current_folder_id, progress)), progress, progress_bar, "Uploading")
+                    uploaded = [r for r in results if isinstance(r, dict)]
+                    st.session_state.upload_failures = [(upload[1], r) for upload, r in zip(uploads, results) if not isinstance(r, dict)]
+                    search_index.add_items([{**f, 'Path': os.path.join(breadcrumb_path, f['name'])} for f in uploaded])
+                    duration = time.time() - progress.started
+                    st.session_state.last_operation_summary = f"✅ Uploaded {len(uploaded)}/{len(uploads)} files ({format_storage(progress.done_bytes)}) in {duration:.2f}s at {progress.done_bytes / duration / (1024*1024) if duration > 0 else 0:.2f} MB/s."
+                    st.session_state.upload_widget_version = st.session_state.get('upload_widget_version', 0) + 1
+                    get_and_sort_folder_items.clear(); st.rerun()
+            search_query = st.text_input("🔎 Search your Drive by name", key="explorer_search", placeholder="Type part of a file or folder name...")
+            if search_query.strip():
+                search_start = time.perf_counter(); search_results = search_index.search(search_query); search_ms = (time.perf_counter() - search_start) * 1000
+                caption = f"{len(search_results)} matches from {len(search_index):,} indexed items in {search_ms:.1f} ms."
+                if not search_index.covers_drive:
+                    # Folders that were never listed or crawled are not in the index yet, so ask Drive as well.
+                    try:
+                        known_ids = {r['id'] for r in search_results}
+                        search_results += [{**f, 'path': f['name']} for f in search_drive_by_name(client, storage['user_email'], search_query.strip()) if f['id'] not in known_ids]
+                        caption += " Drive search used for folders not indexed yet."
+                    except HttpError as e: st.warning(f"Drive search failed: {e}")
+                st.caption(caption)
+                if search_results:
+                    df_search = pd.DataFrame([{'Name': f"{get_file_icon(r)} {r['name']}", 'Path': r['path'], 'Link': r.get('webViewLink', '#')} for r in search_results])
+                    st.dataframe(df_search, column_config={"Link": st.column_config.LinkColumn("Open", display_text="LINK")}, hide_index=True, use_container_width=True)
+                else: st.info("No matching files or folders found.")
+                st.markdown("---")
             st.markdown("""<style>.sticky-header{position:sticky;top:50px;background-color:white;z-index:10;display:flex;flex-direction:row;align-items:center;padding:10px 5px;border-bottom:1px solid #e6e6e6;}.header-col{font-weight:bold;text-align:left;padding:0 4px;color:#262730;}.back-to-top{position:fixed;bottom:20px;right:25px;font-size:25px;background-color:rgba(0,0,0,0.4);color:white;width:50px;height:50px;text-align:center;border-radius:50%;cursor:pointer;opacity:0.7;transition:opacity .3s;text-decoration:none;line-height:50px;z-index:1000;}.back-to-top:hover{opacity:1;}</style>""", unsafe_allow_html=True)
             st.markdown('<a href="#top" class="back-to-top">⬆️</a>', unsafe_allow_html=True)
             if items_to_display is not None:
@@ -630,7 +1463,8 @@ def run_main_app(service, user_info):
                                     new_name = st.text_input("New Name", value=item['name'], label_visibility="collapsed"); form_cols = st.columns(2)
                                     if form_cols[0].form_submit_button("💾", use_container_width=True):
                                         try:
-                                            service.files().update(fileId=item['id'], body={'name': new_name}, supportsAllDrives=True).execute()
+                                            run_async(client.update(item['id'], body={'name': new_name}, supportsAllDrives=True))
+                                            search_index.rename(item['id'], new_name)
                                             get_and_sort_folder_items.clear()
                                             st.toast(f"Renamed to '{new_name}'", icon="✏️")
                                             st.session_state.just_refreshed_explorer = True
@@ -642,17 +1476,22 @@ def run_main_app(service, user_info):
                         with row_cols[6]:
                             action_cols = st.columns(3)
                             if action_cols[0].button("✏️", key=f"rename_btn_{item['id']}", help="Rename"): st.session_state.item_to_rename = item['id']; st.rerun()
-                            if action_cols[1].button("🗑️", key=f"delete_btn_{item['id']}", help="Delete"): st.session_state.item_to_delete = item; st.rerun()
+                            if action_cols[1].button("🗑️", key=f"delete_btn_{item['id']}", help="Move to Trash"): st.session_state.item_to_delete = item; st.rerun()
                             if action_cols[2].button("📋", key=f"copy_btn_{item['id']}", help="Copy to my Drive"): st.session_state.update(link_to_copy=item.get('webViewLink'), auto_fetch_on_load=True, page="Cloud Copy"); st.rerun()
                         if st.session_state.item_to_delete and st.session_state.item_to_delete['id'] == item['id']:
-                            st.warning(f"Are you sure you want to delete **{st.session_state.item_to_delete['name']}**?"); del_cols = st.columns([1,1,4])
-                            if del_cols[0].button("✅ Yes, Delete", key=f"confirm_del_{item['id']}"):
-                                try:
-                                    service.files().delete(fileId=st.session_state.item_to_delete['id'], supportsAllDrives=True).execute()
+                            st.warning(f"Move **{st.session_state.item_to_delete['name']}** to the trash? You can undo this from ♻️ Trash History in the sidebar."); del_cols = st.columns([1,1,4])
+                            if del_cols[0].button("✅ Yes, Trash", key=f"confirm_del_{item['id']}"):
+                                target = st.session_state.item_to_delete
+                                try: errors = run_async(client.trash([target['id']]))
+                                except Exception as e: errors = {target['id']: e}
+                                # Toasts survive the rerun below; an st.error here would be wiped before it is seen.
+                                if errors[target['id']]: st.toast(f"Trash failed: {errors[target['id']]}", icon="⚠️")
+                                else:
+                                    record_trash_job(f"Explorer: {target['name']}", [{'id': target['id'], 'name': target['name'], 'mimeType': target.get('mimeType', ''), 'Path': os.path.join(breadcrumb_path, target['name'])}], errors)
+                                    search_index.remove(target['id'])
                                     get_and_sort_folder_items.clear()
-                                    st.toast(f"Deleted '{st.session_state.item_to_delete['name']}'", icon="🗑️")
+                                    st.toast(f"Moved '{target['name']}' to trash", icon="🗑️")
                                     st.session_state.just_refreshed_explorer = True
-                                except HttpError as e: st.error(f"Delete failed: {e}")
                                 st.session_state.item_to_delete = None; st.rerun()
                             if del_cols[1].button("❌ Cancel", key=f"cancel_del_{item['id']}"): st.session_state.item_to_delete = None; st.rerun()
 
@@ -662,85 +1501,108 @@ def run_main_app(service, user_info):
         
         st.info("Use this tool to copy files or entire folders from a shared link directly into your own Google Drive.")
         st.caption("1. Paste a Google Drive link. | 2. Select the files you want to copy. | 3. Choose a destination in your drive.")
-        def fetch_source_details(service, link):
-            st.session_state.fetched_file_details, st.session_state.folder_contents_df, st.session_state.copied_files_df, st.session_state.dest_id = None, None, None, None; st.session_state.skipped_files_df = None
+        def fetch_source_details(client, link):
+            discard_download_zip()
+            st.session_state.fetched_file_details, st.session_state.folder_contents, st.session_state.copied_files_df, st.session_state.dest_id = None, None, None, None; st.session_state.skipped_files_df = None
             file_id = extract_file_id_from_link(link)
             if file_id:
                 with st.spinner("Fetching details..."):
-                    details = get_file_details(service, file_id)
+                    details = get_file_details(client, file_id)
                     if details:
                         st.session_state.fetched_file_details = details
                         if details['mimeType'] == 'application/vnd.google-apps.folder':
-                            contents, total = list_folder_contents(service, file_id)
-                            if contents: st.session_state.folder_contents_df = create_standard_dataframe(contents)
+                            contents, total = list_folder_contents(client, file_id)
+                            if contents: st.session_state.folder_contents = CrawlStore.from_items(contents)
                             st.session_state.fetched_file_details['size'] = total
-                        else: st.session_state.folder_contents_df = create_standard_dataframe([details])
+                        else: st.session_state.folder_contents = CrawlStore.from_items([details])
             else: st.error("Invalid or empty link provided.")
         if 'drive_link_input' not in st.session_state: st.session_state.drive_link_input = ""
-        if st.session_state.pop('auto_fetch_on_load', False): link_to_process = st.session_state.pop('link_to_copy', ""); st.session_state.drive_link_input = link_to_process; fetch_source_details(service, link_to_process)
+        if st.session_state.pop('auto_fetch_on_load', False): link_to_process = st.session_state.pop('link_to_copy', ""); st.session_state.drive_link_input = link_to_process; fetch_source_details(client, link_to_process)
         st.text_input("Google Drive Shareable Link", key="drive_link_input");
-        if st.button("Fetch Details", key="fetch_details_button"): fetch_source_details(service, st.session_state.drive_link_input)
+        if st.button("Fetch Details", key="fetch_details_button"): fetch_source_details(client, st.session_state.drive_link_input)
         if st.session_state.fetched_file_details:
             details = st.session_state.fetched_file_details; st.markdown("---"); st.subheader(f"Source Details: {get_file_icon(details)} {details.get('name')}")
             is_owner = details.get('owners', [{}])[0].get('emailAddress') == storage['user_email']
             if is_owner: st.success("✅ This is your own file/folder.")
             else: st.warning("🤝 This is a shared file/folder. Content can only be copied to your drive.")
-            if st.session_state.folder_contents_df is not None and not st.session_state.folder_contents_df.empty:
+            edited_data = pd.DataFrame()
+            if st.session_state.folder_contents:
                 st.markdown("##### File Contents"); c1, c2, c3 = st.columns(3)
                 with c1: select_all = st.checkbox("Select/Deselect All", value=True, key="cc_select_all"); st.caption("If none selected, ALL files will be copied.")
                 with c2: show_raw = st.checkbox("Show Raw Data", value=False)
-                with c3: excel_data, _ = generate_excel_report({'File List': st.session_state.folder_contents_df}); st.download_button("📥 Download List as Excel", excel_data, f"{details.get('name', 'file_list')}.xlsx")
-                df = st.session_state.folder_contents_df.copy(); df['Select'] = select_all; visible_columns = ['Select', 'Name', 'Type', 'Size (MB)', 'Modified', 'Owner', 'Link', 'Path']; column_config = { "Link": st.column_config.LinkColumn("File Link", display_text="LINK"), "Size (MB)": st.column_config.NumberColumn(format="%.2f MB") }
+                df = st.session_state.folder_contents.to_dataframe(select_status=select_all)
+                with c3: excel_data, _ = generate_excel_report({'File List': df}); st.download_button("📥 Download List as Excel", excel_data, f"{details.get('name', 'file_list')}.xlsx")
+                visible_columns = ['Select', 'Name', 'Type', 'Size (MB)', 'Modified', 'Owner', 'Link', 'Path']; column_config = { "Link": st.column_config.LinkColumn("File Link", display_text="LINK"), "Size (MB)": st.column_config.NumberColumn(format="%.2f MB") }
                 if not show_raw:
                     for col in df.columns:
                         if col not in visible_columns: column_config[col] = None
-                st.session_state.edited_df = st.data_editor(df, column_order=visible_columns, column_config=column_config, use_container_width=True, hide_index=True, key="cc_data_editor")
-            st.markdown("---"); st.subheader("Copy Destination")
-            try:
-                user_folders = get_user_folders(service)
-                folder_names = ["My Drive (Root)"] + [f['name'] for f in user_folders]
-                folder_ids = ["root"] + [f['id'] for f in user_folders]
-                dest_col1, dest_col2 = st.columns([4, 1])
-                with dest_col1: selected_folder_name = st.selectbox("Select Destination Folder", options=folder_names)
-                with dest_col2:
-                    st.markdown("</br>", unsafe_allow_html=True)
-                    if st.button("🔄", help="Refresh folder list"):
-                        get_user_folders.clear(); st.rerun()
-                new_folder_name = st.text_input("New Folder Name (Optional, creates a sub-folder)")
-                if st.button("🚀 Start Copy Process"):
-                    start_time = time.time()
-                    edited_data = st.session_state.edited_df
-                    if not edited_data["Select"].any(): selected_files = edited_data
-                    else: selected_files = edited_data[edited_data["Select"]]
-                    if selected_files.empty: st.warning("No files found to copy.")
-                    else:
-                        st.session_state.copied_files_df = None; st.session_state.skipped_files_df = None; dest_id = folder_ids[folder_names.index(selected_folder_name)]; final_dest_name = new_folder_name if new_folder_name else selected_folder_name
-                        if new_folder_name:
-                            with st.spinner(f"Creating folder '{new_folder_name}'..."): new_folder = service.files().create(body={'name': new_folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [dest_id]}, fields='id').execute(); dest_id = new_folder['id']
-                        st.session_state.dest_id = dest_id; copied_files_list, skipped_files_list = [], []; progress_bar = st.progress(0, text="Starting copy process...")
-                        total_size_copied = 0
-                        for i, row in enumerate(selected_files.itertuples(name="Pandas")):
-                            progress_text = f"Processing ({i+1}/{len(selected_files)}): {row.Name}"; progress_bar.progress((i + 1) / len(selected_files), text=progress_text)
-                            try: caps_dict = ast.literal_eval(row.capabilities) if isinstance(row.capabilities, str) else row.capabilities
-                            except: caps_dict = {}
-                            if not caps_dict.get('canCopy', True): skipped_files_list.append({'Name': row.Name, 'Reason': 'Copying disabled by owner'}); continue
-                            file_meta = {'name': row.Name.replace('📁 ', '').replace('📄 ', ''), 'parents': [dest_id]}
+                # Only the widget's own edit deltas persist between reruns; the edited frame is rebuilt from the store.
+                edited_data = st.data_editor(df, column_order=visible_columns, column_config=column_config, use_container_width=True, hide_index=True, key="cc_data_editor")
+                with st.expander("📦 Download as ZIP"):
+                    st.caption("Fetches every file in parallel into a ZIP that keeps the folder structure. Google Docs, Sheets, Slides and Drawings are exported to Office/PNG formats; other Google-native types are skipped.")
+                    if st.button("Build ZIP Archive", key="build_zip"):
+                        store = st.session_state.folder_contents; discard_download_zip()
+                        zip_path = new_download_zip_path()
+                        progress = TransferProgress(int(store.sizes.sum())); progress_bar = st.progress(0, text="Starting download...")
+                        try:
+                            skipped = wait_with_progress(submit_async(build_folder_zip(bulk_client, store, zip_path, progress)), progress, progress_bar, "Downloading")
+                            st.session_state.update(download_zip_path=zip_path, download_zip_skipped=skipped)
+                        except Exception as e: os.remove(zip_path); st.error(f"Could not build the archive: {e}")
+                    if st.session_state.get('download_zip_path') and os.path.exists(st.session_state.download_zip_path):
+                        st.success(f"Archive ready: {format_storage(os.path.getsize(st.session_state.download_zip_path))}")
+                        zip_path, zip_name = st.session_state.download_zip_path, f"{details.get('name', 'drive_folder')}.zip"
+                        zip_size = os.path.getsize(zip_path)
+                        if zip_size <= STATIC_SERVING_MAX_BYTES:
+                            if not st.session_state.get('download_zip_static'): st.session_state.download_zip_static = publish_download_zip(zip_path)
+                            st.markdown(f'<a href="app/static/zips/{os.path.basename(st.session_state.download_zip_static)}" download="{html.escape(zip_name, quote=True)}">📥 Download ZIP</a>', unsafe_allow_html=True)
+                            st.caption("Streamed from disk. Anyone with this link can download the archive until it is removed, within an hour.")
+                        else:
+                            # Streamlit serves download buttons from server memory, so the archive is only loaded on the run the user asks for it.
+                            st.warning(f"This archive is larger than the {STATIC_SERVING_MAX_BYTES // (1024*1024)} MB Streamlit can stream from disk. A browser download is not memory-bounded: the whole archive is loaded into server memory for it.")
+                            if st.button("💻 Prepare Browser Download", key="prepare_zip_download", help="Loads the whole archive into server memory for one download."):
+                                with open(zip_path, 'rb') as zip_file: st.download_button("📥 Save ZIP", zip_file, zip_name, "application/zip", on_click="ignore")
+                        if st.button("☁️ Also save a copy to My Drive", key="save_zip", help="Uploads the archive into your My Drive root in resumable chunks; uses your storage quota."):
+                            progress = TransferProgress(zip_size); progress_bar = st.progress(0, text="Saving to Drive...")
                             try:
-                                copied_file = service.files().copy(fileId=row.id, body=file_meta, supportsAllDrives=True, fields='id, name, webViewLink, size, mimeType').execute()
-                                size_bytes = int(copied_file.get('size', 0))
-                                total_size_copied += size_bytes
-                                copied_files_list.append({'Name': copied_file['name'], 'Type': row.Type, 'Size (MB)': float(f"{size_bytes / (1024*1024):.2f}"),'Modified': row.Modified, 'Owner': storage['user_name'], 'Link': copied_file.get('webViewLink', '#'), 'Path': os.path.join(final_dest_name, copied_file['name'])})
-                            except HttpError as e: skipped_files_list.append({'Name': row.Name, 'Reason': f"Error: {e.reason}"}); continue
-                        st.session_state.copied_files_df = pd.DataFrame(copied_files_list) if copied_files_list else pd.DataFrame(); st.session_state.skipped_files_df = pd.DataFrame(skipped_files_list) if skipped_files_list else pd.DataFrame()
-                        end_time = time.time()
-                        duration = end_time - start_time
-                        rate = (total_size_copied / duration) / (1024*1024) if duration > 0 else 0
-                        st.session_state.last_operation_summary = f"✅ Copy complete in {duration:.2f}s. Copied {format_storage(total_size_copied)} at {rate:.2f} MB/s."
-                        st.rerun()
-
-            except Exception as e:
-                st.error(f"Failed to fetch your folders: {e}")
-                st.info("This can happen if you have a very large number of folders in your root directory. Try refreshing the page.")
+                                with open(zip_path, 'rb') as zip_file: saved = wait_with_progress(submit_async(resumable_upload(bulk_client, zip_file, zip_name, 'application/zip', zip_size, 'root', progress)), progress, progress_bar, "Saving to Drive")
+                                st.success(f"Saved to My Drive: [{saved['name']}]({saved.get('webViewLink', '#')})")
+                            except (HttpError, ConnectionError) as e: st.error(f"Could not save the archive to Drive: {e}")
+                        if st.session_state.get('download_zip_skipped'): st.write("⚠️ Skipped Files"); st.dataframe(pd.DataFrame(st.session_state.download_zip_skipped), hide_index=True, use_container_width=True)
+            st.markdown("---"); st.subheader("Copy Destination")
+            selected_folder_id, selected_folder_name = render_destination_picker(client, "cc")
+            new_folder_name = st.text_input("New Folder Name (Optional, creates a sub-folder)")
+            if st.button("🚀 Start Copy Process"):
+                start_time = time.time()
+                if edited_data.empty or not edited_data["Select"].any(): selected_files = edited_data
+                else: selected_files = edited_data[edited_data["Select"]]
+                if selected_files.empty: st.warning("No files found to copy.")
+                else:
+                    st.session_state.copied_files_df = None; st.session_state.skipped_files_df = None; dest_id = selected_folder_id; final_dest_name = new_folder_name if new_folder_name else selected_folder_name
+                    if new_folder_name:
+                        with st.spinner(f"Creating folder '{new_folder_name}'..."): new_folder = run_async(bulk_client.create(body={'name': new_folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [dest_id]}, fields='id')); dest_id = new_folder['id']
+                    st.session_state.dest_id = dest_id; copied_files_list, skipped_files_list = [], []; progress_bar = st.progress(0, text="Starting copy process...")
+                    total_size_copied = 0
+                    pending = {}
+                    for row in selected_files.itertuples(name="Pandas"):
+                        if row.canCopy is False: skipped_files_list.append({'Name': row.Name, 'Reason': 'Copying disabled by owner'}); continue
+                        file_meta = {'name': row.Name.replace('📁 ', '').replace('📄 ', ''), 'parents': [dest_id]}
+                        pending[submit_async(bulk_client.copy(row.id, body=file_meta, supportsAllDrives=True, fields='id, name, webViewLink, size, mimeType'))] = row
+                    copied_by_row = {}
+                    for i, future in enumerate(concurrent.futures.as_completed(pending)):
+                        row = pending[future]; progress_text = f"Processing ({i+1}/{len(pending)}): {row.Name}"; progress_bar.progress((i + 1) / len(pending), text=progress_text)
+                        try:
+                            copied_file = future.result()
+                            size_bytes = int(copied_file.get('size', 0))
+                            total_size_copied += size_bytes
+                            copied_by_row[row.Index] = {'Name': copied_file['name'], 'Type': row.Type, 'Size (MB)': float(f"{size_bytes / (1024*1024):.2f}"),'Modified': row.Modified, 'Owner': storage['user_name'], 'Link': copied_file.get('webViewLink', '#'), 'Path': os.path.join(final_dest_name, copied_file['name'])}
+                        except HttpError as e: skipped_files_list.append({'Name': row.Name, 'Reason': f"Error: {e.reason}"})
+                    copied_files_list = [copied_by_row[row.Index] for row in pending.values() if row.Index in copied_by_row]
+                    st.session_state.copied_files_df = pd.DataFrame(copied_files_list) if copied_files_list else pd.DataFrame(); st.session_state.skipped_files_df = pd.DataFrame(skipped_files_list) if skipped_files_list else pd.DataFrame()
+                    end_time = time.time()
+                    duration = end_time - start_time
+                    rate = (total_size_copied / duration) / (1024*1024) if duration > 0 else 0
+                    st.session_state.last_operation_summary = f"✅ Copy complete in {duration:.2f}s. Copied {format_storage(total_size_copied)} at {rate:.2f} MB/s."
+                    st.rerun()
         if (st.session_state.copied_files_df is not None and not st.session_state.copied_files_df.empty) or (st.session_state.skipped_files_df is not None and not st.session_state.skipped_files_df.empty):
             st.markdown("---"); st.subheader("Process Results"); visible_columns = ['Name', 'Type', 'Size (MB)', 'Modified', 'Owner', 'Link', 'Path']; column_config = { "Link": st.column_config.LinkColumn("File Link", display_text="LINK"), "Size (MB)": st.column_config.NumberColumn(format="%.2f MB"), "Path": st.column_config.TextColumn("Destination Path") }
             if st.session_state.copied_files_df is not None and not st.session_state.copied_files_df.empty: st.write("#### ✅ Copied Files"); df_results = st.session_state.copied_files_df; display_cols = [col for col in visible_columns if col in df_results.columns]; st.dataframe(df_results, column_order=display_cols, column_config=column_config, hide_index=True, use_container_width=True)
@@ -756,28 +1618,28 @@ def run_main_app(service, user_info):
         **How to use it:**
         1.  **Paste a folder link** and click "Fetch & Analyze".
         2.  **Review the analysis:** The app will suggest a common promotional tag to remove from filenames.
-        3.  **Adjust actions:** For each file, decide whether to Rename, Delete, or Keep (if you own it), or Copy/Exclude (if it's shared with you).
+        3.  **Adjust actions:** For each file, decide whether to Rename, Trash, or Keep (if you own it), or Copy/Exclude (if it's shared with you).
         4.  **Choose a destination** (if copying) and start the process!
         """)
         st.text_input("Google Drive Link", key="cleaner_link")
         if st.button("Fetch & Analyze", key="cleaner_fetch"):
             file_id = extract_file_id_from_link(st.session_state.cleaner_link)
             if file_id:
-                root, items = get_owner_and_all_items_recursive(service, file_id)
-                if root: st.session_state.cleaner_root_details = root; st.session_state.cleaner_all_items = items; st.session_state.cleaner_state = 'analyzed'; st.session_state.cleaner_success_log = None; st.session_state.cleaner_skipped_log = None
+                root, items = get_owner_and_all_items_recursive(client, file_id)
+                if root: st.session_state.cleaner_root_details = root; st.session_state.cleaner_contents = CrawlStore.from_items([root] + items if root.get('mimeType') == 'application/vnd.google-apps.folder' else [root], path_key='path'); st.session_state.cleaner_state = 'analyzed'; st.session_state.cleaner_log = None
                 else: st.error("Could not fetch details. Check the link and permissions.")
             else: st.error("Invalid Google Drive link provided.")
         if st.session_state.cleaner_state in ['analyzed', 'finished']:
-            root = st.session_state.cleaner_root_details; items = st.session_state.cleaner_all_items; capabilities = root.get('capabilities', {}); can_edit_directly = capabilities.get('canDelete', False) and capabilities.get('canRename', False); all_content = [root] + items if root.get('mimeType') == 'application/vnd.google-apps.folder' else [root]
+            root = st.session_state.cleaner_root_details; contents = st.session_state.cleaner_contents; capabilities = root.get('capabilities', {}); can_edit_directly = capabilities.get('canTrash', False) and capabilities.get('canRename', False)
             st.markdown("---"); st.subheader(f"{get_file_icon(root)} {root.get('name')}")
             if can_edit_directly: st.success(f"✅ You have full edit permissions for this item.")
             else: st.warning(f"🤝 You have view/comment access. Content can only be copied to your drive.")
             c1, c2 = st.columns(2)
             with c1: show_raw = st.checkbox("Show Raw Data", value=False)
             with c2:
-                df_full_list = create_standard_dataframe(all_content)
-                if not df_full_list.empty: excel_data, excel_filename = generate_excel_report({'File_List': df_full_list}, f"{root.get('name', 'drive_content')}_full_list.xlsx"); st.download_button("📥 Download Full List as Excel", excel_data, excel_filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            st.markdown("---"); st.subheader("Analysis and Cleaning Actions"); suggested_tag, suggested_promo_files = analyze_content(all_content)
+                df_items = contents.to_dataframe()
+                if not df_items.empty: excel_data, excel_filename = generate_excel_report({'File_List': df_items}, f"{root.get('name', 'drive_content')}_full_list.xlsx"); st.download_button("📥 Download Full List as Excel", excel_data, excel_filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            st.markdown("---"); st.subheader("Analysis and Cleaning Actions"); suggested_tag, suggested_promo_files = analyze_content(contents.names)
             st.markdown("**1. Rename Files**"); 
             st.info("Modify filenames by removing text or adding a suffix. For shared content, changes are applied when files are copied to your drive."); 
             col1, col2 = st.columns(2)
@@ -786,68 +1648,82 @@ def run_main_app(service, user_info):
             with col2:
                 st.text_input("Text to ADD as a suffix to all names:", key="cleaner_tag_adder")
             st.markdown("**2. Select Files to Process**"); select_all = st.checkbox("Select/Deselect All", value=True, key="cleaner_select_all"); st.caption("Note: If no files are selected, ALL files will be processed."); st.caption("Click on a cell in the 'Action' column to change it.")
-            df_items = create_standard_dataframe(all_content, select_status=select_all)
+            edited_df = pd.DataFrame()
             if not df_items.empty:
-                df_items['New_Name'] = df_items['Name']
-                tag_to_remove = st.session_state.get("cleaner_tag_remover", "")
-                tag_to_add = st.session_state.get("cleaner_tag_adder", "")
-                def apply_name_changes(name):
-                    new_name = name
-                    if tag_to_remove: new_name = new_name.replace(tag_to_remove, '').strip()
-                    if tag_to_add:
-                        name_part, ext_part = os.path.splitext(new_name)
-                        new_name = f"{name_part} {tag_to_add}{ext_part}"
-                    return new_name
-                df_items['New_Name'] = df_items['Name'].apply(apply_name_changes)
-                if can_edit_directly: df_items['Action'] = df_items.apply(lambda row: 'Delete' if row['Name'] in suggested_promo_files else 'Rename', axis=1)
-                else: df_items['Action'] = df_items.apply(lambda row: 'Exclude' if row['Name'] in suggested_promo_files else 'Copy', axis=1)
-                visible_columns = ['Select', 'Name', 'Type', 'Size (MB)', 'Modified', 'Owner', 'Link', 'Path', 'New_Name', 'Action']; column_config = { "Link": st.column_config.LinkColumn("File Link", display_text="LINK"), "Size (MB)": st.column_config.NumberColumn(format="%.2f MB"), "Action": st.column_config.SelectboxColumn("Action", options=["Copy", "Exclude"] if not can_edit_directly else ["Rename", "Delete", "Keep"], required=True), "Name": st.column_config.TextColumn("File Name", disabled=True), }
+                df_items['Select'] = select_all
+                df_items['New_Name'] = apply_name_changes(df_items['Name'], st.session_state.get("cleaner_tag_remover", ""), st.session_state.get("cleaner_tag_adder", ""))
+                is_promo = df_items['Name'].isin(suggested_promo_files)
+                df_items['Action'] = np.where(is_promo, 'Trash', 'Rename') if can_edit_directly else np.where(is_promo, 'Exclude', 'Copy')
+                visible_columns = ['Select', 'Name', 'Type', 'Size (MB)', 'Modified', 'Owner', 'Link', 'Path', 'New_Name', 'Action']; column_config = { "Link": st.column_config.LinkColumn("File Link", display_text="LINK"), "Size (MB)": st.column_config.NumberColumn(format="%.2f MB"), "Action": st.column_config.SelectboxColumn("Action", options=["Copy", "Exclude"] if not can_edit_directly else ["Rename", "Trash", "Keep"], required=True), "Name": st.column_config.TextColumn("File Name", disabled=True), }
                 if not show_raw:
                     for col in df_items.columns:
                         if col not in visible_columns: column_config[col] = None
-                st.session_state.edited_df = st.data_editor(df_items, column_order=visible_columns, column_config=column_config, use_container_width=True, height=400, key="cleaner_data_editor", hide_index=True)
+                edited_df = st.data_editor(df_items, column_order=visible_columns, column_config=column_config, use_container_width=True, height=400, key="cleaner_data_editor", hide_index=True)
+            plan = plan_cleaner_operations(edited_df, can_edit_directly) if not edited_df.empty else None
+            if plan is not None:
+                st.markdown("**Dry Run: Planned Operations**"); plan_summary = summarize_plan(plan, can_edit_directly); counts = plan_summary['counts']
+                m1, m2, m3, m4, m5 = st.columns(5)
+                if can_edit_directly: m1.metric("Renames", counts['rename']); m2.metric("To Trash", counts['trash'])
+                else: m1.metric("Copies", counts['copy']); m2.metric("Copy Restricted", counts['blocked'])
+                m3.metric("No-ops (no API call)", counts['noop']); m4.metric("API Calls", plan_summary['api_calls']); m5.metric("Est. Runtime", f"{plan_summary['estimated_seconds']:.1f}s")
+                if plan_summary['collisions']:
+                    st.warning(f"⚠️ {plan_summary['collisions']} files would end up sharing a name with another file in the same folder. Drive allows this, but you may want to adjust `New_Name` first.")
+                    st.dataframe(plan.loc[plan['Collision'], ['Name', 'New_Name', 'Path', 'Action']], hide_index=True, use_container_width=True)
+            st.markdown("**3. Choose Destination (for copying shared content)**")
+            # The picker lives outside the form because it navigates with buttons.
+            if can_edit_directly: dest_folder_id = None; st.caption("Not needed: files are cleaned in place.")
+            else: dest_folder_id, _ = render_destination_picker(client, "cleaner")
             with st.form("submission_form"):
-                st.markdown("**3. Choose Destination (for copying shared content)**"); user_folders = get_user_folders(service); folder_names, folder_ids = ["My Drive (Root)"] + [f['name'] for f in user_folders], ["root"] + [f['id'] for f in user_folders]; dest_col1, dest_col2 = st.columns(2)
-                with dest_col1: dest_folder_id = st.selectbox("Select Destination Folder", options=folder_ids, format_func=lambda x: dict(zip(folder_ids, folder_names)).get(x, "N/A"), disabled=can_edit_directly)
-                with dest_col2: new_folder_name = st.text_input("New Folder Name (Optional)", disabled=can_edit_directly, help="If blank, the original folder name will be used.")
+                new_folder_name = st.text_input("New Folder Name (Optional)", disabled=can_edit_directly, help="If blank, the original folder name will be used.")
                 button_text = "🚀 Start Cleaning Process" if can_edit_directly else "🚀 Start Copying and Cleaning Process"; submitted = st.form_submit_button(button_text, type="primary")
                 if submitted:
-                    edited_df = st.session_state.edited_df
-                    if not edited_df.empty:
-                        if not edited_df["Select"].any(): actions_to_perform = edited_df
-                        else: actions_to_perform = edited_df[edited_df["Select"]]
+                    if plan is not None:
+                        actions_to_perform = plan[plan['Selected']]
                         log_entries = []; final_dest_id = dest_folder_id; new_root_folder_name = ""
                         start_time = time.time()
                         total_size_copied = 0
                         with st.spinner("Processing files... Please wait."):
                             if not can_edit_directly:
-                                new_root_folder_name = new_folder_name if new_folder_name else root.get('name'); st.session_state.cleaner_dest_folder_name = new_root_folder_name; st.text(f"Creating new root folder: '{new_root_folder_name}'"); new_folder_meta = {'name': new_root_folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [dest_folder_id]}; new_folder = service.files().create(body=new_folder_meta, fields='id', supportsAllDrives=True).execute(); final_dest_id = new_folder.get('id')
-                            progress_bar = st.progress(0)
-                            for i, row in enumerate(actions_to_perform.itertuples(name='Pandas')):
-                                progress_bar.progress((i + 1) / len(actions_to_perform), text=f"Processing: {row.Name}"); log_entry = {'Status': 'Skipped', 'Name': row.Name, 'New Name': row.New_Name, 'Path': row.Path, 'Size (MB)': row._asdict().get('Size (MB)'), 'Link': 'N/A', 'Owner': row.Owner, 'Modified': row.Modified, 'Type': row.Type}
+                                new_root_folder_name = new_folder_name if new_folder_name else root.get('name'); st.session_state.cleaner_dest_folder_name = new_root_folder_name; st.text(f"Creating new root folder: '{new_root_folder_name}'"); new_folder_meta = {'name': new_root_folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [dest_folder_id]}; new_folder = run_async(bulk_client.create(body=new_folder_meta, fields='id', supportsAllDrives=True)); final_dest_id = new_folder.get('id')
+                            def base_log_entry(row): return {'Status': 'Skipped', 'Name': row.Name, 'New Name': row.New_Name, 'Path': row.Path, 'Size (MB)': row._asdict().get('Size (MB)'), 'Link': 'N/A', 'Owner': row.Owner, 'Modified': row.Modified, 'Type': row.Type}
+                            async def process_row(row):
+                                log_entry = base_log_entry(row); size_bytes = 0
                                 if can_edit_directly:
-                                    if row.Action == 'Delete':
-                                        try: service.files().delete(fileId=row.id, supportsAllDrives=True).execute(); log_entry.update({'Status': 'Deleted', 'New Name': 'N/A', 'Size (MB)': 'N/A'})
-                                        except HttpError as e: log_entry.update({'Status': f'Error Deleting: {e.reason}'})
-                                    elif row.Action == 'Rename' and row.Name != row.New_Name:
-                                        try: updated_file = service.files().update(fileId=row.id, body={'name': row.New_Name}, supportsAllDrives=True, fields='webViewLink, size').execute(); log_entry.update({'Status': 'Renamed', 'Link': updated_file.get('webViewLink'), 'Size (MB)': float(f"{int(updated_file.get('size', 0)) / (1024*1024):.2f}") if updated_file.get('size') else 'N/A', 'Path': row.Path})
+                                    if row.Operation == 'rename':
+                                        try: updated_file = await bulk_client.update(row.id, body={'name': row.New_Name}, supportsAllDrives=True, fields='webViewLink, size'); search_index.rename(row.id, row.New_Name); log_entry.update({'Status': 'Renamed', 'Link': updated_file.get('webViewLink'), 'Size (MB)': float(f"{int(updated_file.get('size', 0)) / (1024*1024):.2f}") if updated_file.get('size') else 'N/A', 'Path': row.Path})
                                         except HttpError as e: log_entry.update({'Status': f'Error Renaming: {e.reason}'})
                                 else: # Copying logic
-                                    if row.Action == 'Copy':
-                                        try: capabilities_dict = ast.literal_eval(row.capabilities) if isinstance(row.capabilities, str) else row.capabilities
-                                        except (ValueError, SyntaxError): capabilities_dict = {}
-                                        if not capabilities_dict.get('canCopy', False): log_entry['Status'] = 'Skipped (Copy restricted)'
-                                        else:
-                                            try:
-                                                file_meta = {'name': row.New_Name, 'parents': [final_dest_id]}; copied_file = service.files().copy(fileId=row.id, body=file_meta, supportsAllDrives=True, fields='id, name, webViewLink, size').execute()
-                                                size_bytes = int(copied_file.get('size', 0))
-                                                total_size_copied += size_bytes
-                                                dest_path = os.path.join(new_root_folder_name, os.path.basename(row.Path)) if row.Path else new_root_folder_name
-                                                log_entry.update({'Status': 'Copied to Drive', 'New Name': copied_file['name'], 'Path': dest_path, 'Size (MB)': float(f"{size_bytes / (1024*1024):.2f}"), 'Link': copied_file.get('webViewLink', '#'), 'Owner': storage['user_name']})
-                                            except HttpError as e: log_entry['Status'] = f'Error Copying: {e.reason}'
-                                log_entries.append(log_entry)
-                        if log_entries: df_log = pd.DataFrame(log_entries); st.session_state.cleaner_success_log = df_log[df_log['Status'].isin(['Renamed', 'Deleted', 'Copied to Drive'])]; st.session_state.cleaner_skipped_log = df_log[~df_log['Status'].isin(['Renamed', 'Deleted', 'Copied to Drive'])]
-                        else: st.session_state.cleaner_success_log = pd.DataFrame(); st.session_state.cleaner_skipped_log = pd.DataFrame()
+                                    try:
+                                        file_meta = {'name': row.New_Name, 'parents': [final_dest_id]}; copied_file = await bulk_client.copy(row.id, body=file_meta, supportsAllDrives=True, fields='id, name, webViewLink, size')
+                                        size_bytes = int(copied_file.get('size', 0))
+                                        dest_path = os.path.join(new_root_folder_name, os.path.basename(row.Path)) if row.Path else new_root_folder_name
+                                        log_entry.update({'Status': 'Copied to Drive', 'New Name': copied_file['name'], 'Path': dest_path, 'Size (MB)': float(f"{size_bytes / (1024*1024):.2f}"), 'Link': copied_file.get('webViewLink', '#'), 'Owner': storage['user_name']})
+                                    except HttpError as e: log_entry['Status'] = f'Error Copying: {e.reason}'
+                                return log_entry, size_bytes
+                            progress_bar = st.progress(0)
+                            # Only effective operations reach the API; no-op and restricted rows are logged directly.
+                            results_by_index = {}
+                            for i, row in enumerate(actions_to_perform.itertuples(name='Pandas')):
+                                if row.Operation in ('noop', 'blocked'): results_by_index[i] = {**base_log_entry(row), 'Status': 'Skipped (Copy restricted)' if row.Operation == 'blocked' else 'Skipped'}
+                            # Trashes go out together in batch requests so the whole job can be restored from one undo-log entry.
+                            trash_rows = [(i, row) for i, row in enumerate(actions_to_perform.itertuples(name='Pandas')) if row.Operation == 'trash']
+                            trash_future = submit_async(bulk_client.trash([row.id for _, row in trash_rows])) if trash_rows else None
+                            pending = {submit_async(process_row(row)): (i, row) for i, row in enumerate(actions_to_perform.itertuples(name='Pandas')) if i not in results_by_index and row.Operation != 'trash'}
+                            for done, future in enumerate(concurrent.futures.as_completed(pending)):
+                                i, row = pending[future]; progress_bar.progress((done + 1) / len(pending), text=f"Processing: {row.Name}")
+                                try: results_by_index[i], size_bytes = future.result(); total_size_copied += size_bytes
+                                except Exception as e: results_by_index[i] = {**base_log_entry(row), 'Status': f'Error: {e}'}
+                            if trash_future:
+                                progress_bar.progress(1.0, text=f"Moving {len(trash_rows)} files to trash...")
+                                # Whatever Drive reports as trashed is always logged, so the job stays restorable even after partial failures.
+                                try: trash_errors = trash_future.result()
+                                except Exception as e: trash_errors = {row.id: e for _, row in trash_rows}
+                                for i, row in trash_rows:
+                                    error = trash_errors[row.id]; results_by_index[i] = {**base_log_entry(row), 'Status': f"Error Trashing: {getattr(error, 'reason', error)}"} if error else {**base_log_entry(row), 'Status': 'Trashed', 'New Name': 'N/A', 'Size (MB)': 'N/A'}
+                                    if not error: search_index.remove(row.id)
+                                record_trash_job(f"Cleaner: {root.get('name')}", [{'id': row.id, 'name': row.Name, 'mimeType': row.mimeType, 'Path': row.Path} for _, row in trash_rows], trash_errors)
+                            log_entries = [results_by_index[i] for i in sorted(results_by_index)]
+                        st.session_state.cleaner_log = pd.DataFrame(log_entries)
                         end_time = time.time()
                         duration = end_time - start_time
                         rate = (total_size_copied / duration) / (1024*1024) if duration > 0 else 0
@@ -857,10 +1733,15 @@ def run_main_app(service, user_info):
             st.subheader("✅ Process Complete")
             if st.session_state.cleaner_dest_folder_name: st.info(f"Files were copied to a new folder named: **{st.session_state.cleaner_dest_folder_name}**")
             results_config = {"Link": st.column_config.LinkColumn("File Link", display_text="LINK"),"Size (MB)": st.column_config.NumberColumn(format="%.2f MB"),"Path": st.column_config.TextColumn("Destination Path"),"Name": st.column_config.TextColumn("File Name")}
-            if st.session_state.cleaner_success_log is not None and not st.session_state.cleaner_success_log.empty: st.write("#### Successful Actions"); df_success = st.session_state.cleaner_success_log; st.dataframe(df_success, use_container_width=True, hide_index=True, column_config=results_config)
-            if st.session_state.cleaner_skipped_log is not None and not st.session_state.cleaner_skipped_log.empty: st.write("#### ⚠️ Skipped Files & Errors"); df_skipped = st.session_state.cleaner_skipped_log; st.dataframe(df_skipped, use_container_width=True, hide_index=True)
-            report_dfs = {'Successful_Actions': st.session_state.cleaner_success_log, 'Skipped_and_Errors': st.session_state.cleaner_skipped_log}; excel_data, _ = generate_excel_report(report_dfs, "cleaning_report.xlsx"); st.download_button("📥 Download Full Report", excel_data, "cleaning_report.xlsx")
-            if (st.session_state.cleaner_success_log is None or st.session_state.cleaner_success_log.empty) and (st.session_state.cleaner_skipped_log is None or st.session_state.cleaner_skipped_log.empty): st.info("No actions were performed.")
+            df_log = st.session_state.cleaner_log if st.session_state.cleaner_log is not None else pd.DataFrame()
+            # One log is kept per job; the success and skipped tables are views over it.
+            df_success, df_skipped = pd.DataFrame(), pd.DataFrame()
+            if not df_log.empty: is_success = df_log['Status'].isin(['Renamed', 'Trashed', 'Copied to Drive']); df_success, df_skipped = df_log[is_success], df_log[~is_success]
+            if not df_success.empty: st.write("#### Successful Actions"); st.dataframe(df_success, use_container_width=True, hide_index=True, column_config=results_config)
+            if not df_skipped.empty: st.write("#### ⚠️ Skipped Files & Errors"); st.dataframe(df_skipped, use_container_width=True, hide_index=True)
+            report_dfs = {'Successful_Actions': df_success, 'Skipped_and_Errors': df_skipped}; excel_data, _ = generate_excel_report(report_dfs, "cleaning_report.xlsx"); st.download_button("📥 Download Full Report", excel_data, "cleaning_report.xlsx")
+            if not df_log.empty and df_log['Status'].eq('Trashed').any(): st.info("Trashed files can be restored from ♻️ Trash History in the sidebar.")
+            if df_log.empty: st.info("No actions were performed.")
             st.button("Start New Task", on_click=reset_cleaner_state)
 
 # --- MAIN APPLICATION CONTROL FLOW (FROM app.py) ---
@@ -870,6 +1751,7 @@ service = get_gdrive_service()
 if service:
     user_info = get_drive_storage_info(service)
     if user_info:
+        st.session_state.user_info = user_info
         authorized_users = get_authorized_users()
         if authorized_users is not None:
             is_authorized = user_info['user_email'].lower().strip() in authorized_users